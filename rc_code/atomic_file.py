@@ -0,0 +1,26 @@
+__author__ = 'zweiss'
+
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def open_atomic(target_file, mode='w'):
+    """
+    Opens a file that replaces a target file once it is written completely. The content is written to a temporary
+    file next to the target, which is renamed to the target when the with block ends without an error; renaming
+    within a directory is atomic, so processes reading the target concurrently, e.g. pool workers loading a cache,
+    see either the old or the complete new file and never a partly written one
+    :param target_file: file to be replaced
+    :param mode: writing mode, 'w' for text or 'wb' for binary files
+    :return: context manager of the temporary file stream
+    """
+
+    temporary_file = target_file + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(temporary_file, mode) as out:
+            yield out
+        os.replace(temporary_file, target_file)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
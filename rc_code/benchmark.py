@@ -0,0 +1,422 @@
+__author__ = 'zweiss'
+
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import counts as cnt
+import features as feat
+import readability_formulae as rf
+import nlp
+from main import analyse_file
+
+# vocabulary of the synthetic German corpora
+WORDS = ['der', 'die', 'das', 'und', 'ist', 'nicht', 'ein', 'eine', 'mit', 'auf', 'für', 'von', 'sich', 'auch', 'es',
+         'wir', 'sie', 'er', 'ich', 'noch', 'nach', 'wie', 'über', 'aber', 'schon', 'wenn', 'nur', 'sehr', 'heute',
+         'Haus', 'Baum', 'Schule', 'Kinder', 'Straße', 'Stadt', 'Zeit', 'Jahr', 'Arbeit', 'Leute', 'Frage', 'Welt',
+         'Häuser', 'Äpfel', 'Öffnung', 'Übung', 'Bäume', 'Mädchen', 'Fußball', 'Frühstück', 'Müller', 'Würde',
+         'Bundesverfassungsgericht', 'Lebensversicherungsgesellschaft', 'Aussprache', 'Seeufer', 'Feuerwehr',
+         'Haarschnitt', 'Eisenbahn', 'Bauausstellung', 'Poesie', 'Kooperation', 'Universität', 'Bibliothek',
+         'Wissenschaft', 'Verantwortung', 'Entwicklung', 'Gesellschaft', 'Möglichkeit', 'Regierung', 'Erfahrung',
+         'laufen', 'gehen', 'sagen', 'machen', 'geben', 'kommen', 'sollen', 'wollen', 'stehen', 'finden', 'bleiben',
+         'liegen', 'heißen', 'denken', 'nehmen', 'glauben', 'verstehen', 'beschreiben', 'entscheiden', 'erklären',
+         'schnell', 'langsam', 'groß', 'klein', 'neu', 'alt', 'gut', 'schön', 'schwierig', 'einfach', 'eigentlich',
+         'wahrscheinlich', 'außerordentlich', 'selbstverständlich', 'z.B.', 'Dr.', 'usw.', 'ca.', '2016', '42',
+         '"', '(', ')', ',', ',', ',', ';', '-']
+
+# letters of the generated German word list the syllable counter is checked on, see get_syllable_word_list
+SYLLABLE_LETTERS = 'aeiouyäöüAEIOUYÄÖÜbcdfghklmnpqrstwxzßBSZ-0'
+
+# text scored by a fresh interpreter to measure the cold start
+STARTUP_TEXT = 'Das ist ein kurzer Text. Er besteht aus zwei Sätzen.'
+
+# modules of the scoring path, importing them must not import nltk or numpy
+SCORING_MODULES = ['nlp', 'counts', 'features', 'readability_formulae', 'main']
+
+# corpora of the benchmark: number of documents, sentences per document and words per sentence
+CORPORA = {
+    'short_sentences': {'num_documents': 100, 'num_sentences': (20, 40), 'num_words': (3, 8)},
+    'long_documents': {'num_documents': 4, 'num_sentences': (2000, 3000), 'num_words': (10, 30)},
+    'many_tiny_files': {'num_documents': 2000, 'num_sentences': (1, 2), 'num_words': (3, 10)}
+}
+
+
+def generate_corpus(num_documents, num_sentences, num_words, seed=1):
+    """
+    Generates a synthetic German corpus
+    :param num_documents: number of documents
+    :param num_sentences: minimal and maximal number of sentences per document
+    :param num_words: minimal and maximal number of words per sentence
+    :param seed: seed of the random generator, the same seed always generates the same corpus
+    :return: list of documents
+    """
+
+    random_generator = random.Random(seed)
+    documents = []
+    for d in range(num_documents):
+        sentences = []
+        for s in range(random_generator.randint(*num_sentences)):
+            words = [random_generator.choice(WORDS) for w in range(random_generator.randint(*num_words))]
+            words[0] = words[0].capitalize()
+            sentences.append(' '.join(words) + random_generator.choice(['.', '.', '.', '!', '?', ':']))
+        documents.append(' '.join(sentences))
+    return documents
+
+
+def time_stage(function, repeat):
+    """
+    Times a benchmark stage
+    :param function: function without arguments running the stage once
+    :param repeat: number of runs
+    :return: shortest wall time of all runs in seconds
+    """
+
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def benchmark_corpus(documents, repeat=3):
+    """
+    Times every stage of the analysis pipeline on a corpus
+    :param documents: list of documents
+    :param repeat: number of runs per stage, the fastest run is reported
+    :return: dictionary of stages with seconds, tokens per second and documents per second
+    """
+
+    analyzer = nlp.get_analyzer()
+    regex_analyzer = nlp.ReadabilityAnalyzer(tokenizer='regex')
+    sentences = [analyzer.get_sentences(document) for document in documents]
+    tokenized_documents = [[analyzer.get_tokens(sentence) for sentence in document] for document in sentences]
+    words = [token for document in tokenized_documents for sentence in document for token in sentence
+             if token not in nlp.get_punctuation_set()]
+    count_dicts = [cnt.get_counts(document) for document in tokenized_documents]
+    feature_dicts = [feat.get_features(count_dict) for count_dict in count_dicts]
+    count_columns = {key: [count_dict[key] for count_dict in count_dicts] for key in count_dicts[0].keys()}
+    num_tokens = sum(count_dict['COUNTS_num_tokens'] for count_dict in count_dicts)
+
+    def count_all():
+        # every run starts with an empty syllable cache
+        nlp.set_syllable_cache(nlp.SyllableCache())
+        for document in tokenized_documents:
+            cnt.get_counts(document)
+
+    # write the corpus to files for the end to end stage
+    tmp_dir = tempfile.mkdtemp()
+    files = []
+    for i, document in enumerate(documents):
+        files.append(os.path.join(tmp_dir, str(i) + '.txt'))
+        with open(files[-1], 'w') as out:
+            out.write(document)
+
+    def count_all_batch():
+        nlp.set_syllable_cache(nlp.SyllableCache())
+        cnt.get_counts_batch(tokenized_documents)
+
+    def analyse_all():
+        nlp.set_syllable_cache(nlp.SyllableCache())
+        for txt_file in files:
+            analyse_file(txt_file)
+
+    stages = {
+        'sentences': lambda: [analyzer.get_sentences(document) for document in documents],
+        'tokens': lambda: [[analyzer.get_tokens(sentence) for sentence in document] for document in sentences],
+        'sentences_and_tokens': lambda: [analyzer.get_tokenized_sentences(document) for document in documents],
+        'sentences_and_tokens_regex': lambda: [regex_analyzer.get_tokenized_sentences(document)
+                                               for document in documents],
+        'syllables': lambda: [nlp.get_num_syllables(word) for word in words],
+        'counts': count_all,
+        'counts_batch': count_all_batch,
+        'features': lambda: [feat.get_features(count_dict) for count_dict in count_dicts],
+        'features_batch': lambda: feat.get_features_batch(count_columns),
+        'formulae': lambda: [rf.get_formulae(feature_dict) for feature_dict in feature_dicts],
+        'analyse_file': analyse_all
+    }
+    results = {}
+    for stage, function in stages.items():
+        seconds = time_stage(function, repeat)
+        results[stage] = {'seconds': seconds,
+                          'tokens_per_second': 0 if seconds == 0 else num_tokens / seconds,
+                          'documents_per_second': 0 if seconds == 0 else len(documents) / seconds}
+    shutil.rmtree(tmp_dir)
+
+    return {'num_documents': len(documents), 'num_tokens': num_tokens, 'stages': results,
+            'tokenizer_differences': check_tokenizer_conformance(documents),
+            'feature_differences': check_feature_conformance(count_dicts), 'peak_rss_kb': get_peak_rss_kb()}
+
+
+def check_feature_conformance(count_dicts):
+    """
+    Compares the features of features.get_features_batch to those of features.get_features, on the counts of a corpus
+    and on counts with every combination of zero denominators
+    :param count_dicts: list of count dictionaries
+    :return: number of count dictionaries with different features
+    """
+
+    keys = sorted(set(key for feature, numerator, denominator in feat.FEATURE_RATIOS
+                      for key in (numerator, denominator)))
+    denominators = sorted(set(denominator for feature, numerator, denominator in feat.FEATURE_RATIOS))
+    count_dicts = list(count_dicts)
+    for i in range(2 ** len(denominators)):
+        count_dict = {key: 7 for key in keys}
+        count_dict.update({key: 0 for j, key in enumerate(denominators) if i >> j & 1})
+        count_dicts.append(count_dict)
+
+    batch = feat.get_features_batch({key: [count_dict[key] for count_dict in count_dicts] for key in keys})
+    differences = 0
+    for i, count_dict in enumerate(count_dicts):
+        if any(batch[key][i] != value for key, value in feat.get_features(count_dict).items()):
+            differences += 1
+    return differences
+
+
+def check_tokenizer_conformance(documents):
+    """
+    Compares the tokens of the regex tokenizer backend to those of nltk's WordPunctTokenizer on whole documents. All
+    unicode characters are compared once by test_nlp.test_regex_tokenizer_equals_nltk, as they do not depend on the
+    corpus
+    :param documents: list of documents
+    :return: number of documents that are tokenized differently
+    """
+
+    analyzer = nlp.get_analyzer()
+    regex_analyzer = nlp.ReadabilityAnalyzer(tokenizer='regex')
+    differences = 0
+    for document in documents:
+        if regex_analyzer.get_tokenized_sentences(document) != analyzer.get_tokenized_sentences(document):
+            differences += 1
+    return differences
+
+
+def benchmark_startup(repeat=3, sentence_model_cache=None):
+    """
+    Times fresh interpreters importing the scoring modules and scoring a single short text
+    :param repeat: number of runs per stage, the fastest run is reported
+    :param sentence_model_cache: json file caching the parameters of the sentence model, see
+    nlp.load_sentence_tokenizer
+    :return: dictionary of stages as in benchmark_corpus and of the heavy modules imported with the scoring modules
+    """
+
+    import_code = 'import sys\nimport ' + ', '.join(SCORING_MODULES) + '\n' + \
+                  'print(",".join(m for m in ("nltk", "numpy", "pandas") if m in sys.modules))'
+    score_code = 'import nlp\nfrom main import analyse_text\n' + \
+                 'nlp.set_analyzer(nlp.ReadabilityAnalyzer(sentence_model_cache=' + repr(sentence_model_cache) + \
+                 '))\nanalyse_text(' + repr(STARTUP_TEXT) + ')'
+    cwd = os.path.dirname(os.path.abspath(__file__))
+
+    results = {}
+    for stage, code in (('import', import_code), ('cold_start', score_code)):
+        seconds = time_stage(lambda: subprocess.check_call([sys.executable, '-c', code], cwd=cwd,
+                                                           stdout=subprocess.DEVNULL), repeat)
+        results[stage] = {'seconds': seconds, 'tokens_per_second': 0,
+                          'documents_per_second': 0 if seconds == 0 else 1 / seconds}
+
+    # heavy modules must only be imported when they are used
+    output = subprocess.check_output([sys.executable, '-c', import_code], cwd=cwd, universal_newlines=True)
+    heavy_imports = [module for module in output.strip().split(',') if module != '']
+
+    return {'num_documents': 1, 'num_tokens': 0, 'stages': results, 'heavy_imports': heavy_imports}
+
+
+def get_num_syllables_reference(unit):
+    """
+    Returns the number of syllables in a given unit with the character loop nlp.get_num_syllables was replaced by,
+    the reference of check_syllable_conformance
+    :param unit: unit to be counted
+    :return: number of syllables
+    """
+
+    num_syllables = 0
+    vowels = ['a', 'e', 'i', 'o', 'u', 'y', 'ü', 'ä', 'ö']
+    tmp = "#" + unit.lower() + '#'  # '#' for easier iteration
+
+    skip = False
+    for c in range(0, len(tmp)-1):
+
+        if skip:
+            skip = False
+            continue
+
+        cur_char = tmp[c]
+        next_char = tmp[c+1]
+
+        # increase number of syllables, if current character is a vowel
+        if cur_char in vowels:
+            num_syllables += 1
+
+        # ignore next character, if character bigram is a diphtong, i.e.
+        # the current character is a) the same as the next, b) an e, u, i or y
+        if (cur_char in vowels and next_char in vowels) or cur_char == next_char:
+            skip = True
+
+    return num_syllables
+
+
+def get_syllable_word_list(num_words=200000, seed=1):
+    """
+    Generates a large German word list: all words of up to three letters of SYLLABLE_LETTERS, the words of the
+    synthetic corpora, compounds of them and random words of up to 30 letters, e.g. with runs of vowels and umlauts
+    :param num_words: number of compounds and random words
+    :param seed: seed of the random generator
+    :return: list of words
+    """
+
+    random_generator = random.Random(seed)
+    words = list(SYLLABLE_LETTERS)
+    words += [a + b for a in SYLLABLE_LETTERS for b in SYLLABLE_LETTERS]
+    words += [a + b + c for a in SYLLABLE_LETTERS for b in SYLLABLE_LETTERS for c in SYLLABLE_LETTERS]
+    words += WORDS
+    for w in range(num_words // 2):
+        words.append(''.join(random_generator.choice(WORDS) for p in range(random_generator.randint(2, 4))))
+        words.append(''.join(random_generator.choice(SYLLABLE_LETTERS) for c in range(random_generator.randint(4, 30))))
+    return words
+
+
+def check_syllable_conformance(words):
+    """
+    Compares the syllables counted by nlp.get_num_syllables to those of the replaced character loop
+    :param words: list of words, see get_syllable_word_list
+    :return: number of words with a different number of syllables
+    """
+
+    return sum(nlp.get_num_syllables(word) != get_num_syllables_reference(word) for word in words)
+
+
+def get_peak_rss_kb():
+    """
+    Returns the peak resident set size of this process
+    :return: peak resident set size in kilobytes
+    """
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def run_benchmarks(corpora=None, seed=1, repeat=3, sentence_model_cache=None):
+    """
+    Runs the benchmark on all synthetic corpora and times the start of the scoring path as corpus 'startup'. The
+    syllable counter is checked against the replaced character loop, see check_syllable_conformance
+    :param corpora: names of the corpora to be used, all corpora of CORPORA if None
+    :param seed: seed of the corpus generation
+    :param repeat: number of runs per stage
+    :param sentence_model_cache: json file caching the parameters of the sentence model for the startup benchmark
+    :return: dictionary of benchmark results
+    """
+
+    results = {'python': sys.version.split()[0], 'seed': seed, 'repeat': repeat, 'corpora': {}}
+    for name in sorted(CORPORA.keys() if corpora is None else corpora):
+        print('Benchmarking ' + name)
+        documents = generate_corpus(seed=seed, **CORPORA[name])
+        results['corpora'][name] = benchmark_corpus(documents, repeat)
+    print('Benchmarking startup')
+    results['corpora']['startup'] = benchmark_startup(repeat, sentence_model_cache)
+    print('Checking the syllable counter')
+    results['syllable_differences'] = check_syllable_conformance(get_syllable_word_list(seed=seed))
+    results['peak_rss_kb'] = get_peak_rss_kb()
+    return results
+
+
+def compare_benchmarks(old_results, new_results, threshold=0.1):
+    """
+    Compares two benchmark runs stage by stage
+    :param old_results: results of the earlier run
+    :param new_results: results of the later run
+    :param threshold: relative slowdown above which a stage counts as regression
+    :return: list of tuples of corpus, stage, old seconds, new seconds and True if the stage regressed
+    """
+
+    comparison = []
+    for name, corpus in sorted(new_results['corpora'].items()):
+        if name not in old_results['corpora']:
+            continue
+        for stage, result in sorted(corpus['stages'].items()):
+            if stage not in old_results['corpora'][name]['stages']:
+                continue
+            old_seconds = old_results['corpora'][name]['stages'][stage]['seconds']
+            comparison.append((name, stage, old_seconds, result['seconds'],
+                               result['seconds'] > old_seconds * (1 + threshold)))
+    return comparison
+
+
+if __name__ == '__main__':
+
+    # check for correct number of arguments
+    usage = 'Wrong number of arguments, call: python3 benchmark.py <output file>.json ' \
+            '(--compare <earlier output file>.json) (--repeat N) (--sentence-cache <cache file>.json)'
+    if len(sys.argv) < 2:
+        sys.exit(usage)
+
+    # read optional arguments
+    compare_file = None
+    repeat = 3
+    sentence_model_cache = None
+    args = sys.argv[2:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == '--compare' and len(args) > 0:
+            compare_file = args.pop(0)
+        elif arg == '--repeat' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            repeat = int(args.pop(0))
+        elif arg == '--sentence-cache' and len(args) > 0:
+            sentence_model_cache = args.pop(0)
+        else:
+            sys.exit(usage)
+
+    # run benchmark and save results
+    benchmark_results = run_benchmarks(repeat=repeat, sentence_model_cache=sentence_model_cache)
+    with open(sys.argv[1], 'w') as out:
+        json.dump(benchmark_results, out, indent=2, sort_keys=True)
+    for corpus_name, corpus_results in sorted(benchmark_results['corpora'].items()):
+        for stage_name, stage_results in sorted(corpus_results['stages'].items()):
+            print(corpus_name + ' ' + stage_name + ': ' + str(round(stage_results['seconds'], 4)) + ' s, ' +
+                  str(int(stage_results['tokens_per_second'])) + ' tokens/s, ' +
+                  str(int(stage_results['documents_per_second'])) + ' documents/s')
+    print('Peak RSS: ' + str(benchmark_results['peak_rss_kb']) + ' kB')
+    print('Results written to ' + sys.argv[1])
+
+    # the regex tokenizer backend has to produce the tokens of nltk
+    differences = sum(corpus_results.get('tokenizer_differences', 0)
+                      for corpus_results in benchmark_results['corpora'].values())
+    if differences > 0:
+        sys.exit('The regex tokenizer differs from nltk in ' + str(differences) + ' document(s).')
+
+    # the syllable counter has to count the syllables of the replaced character loop
+    if benchmark_results['syllable_differences'] > 0:
+        sys.exit('The syllable counter differs from the character loop in ' +
+                 str(benchmark_results['syllable_differences']) + ' word(s).')
+
+    # the batch features have to be the features of every single document
+    differences = sum(corpus_results.get('feature_differences', 0)
+                      for corpus_results in benchmark_results['corpora'].values())
+    if differences > 0:
+        sys.exit('The batch features differ in ' + str(differences) + ' set(s) of counts.')
+
+    # heavy modules must only be imported when they are used
+    heavy_imports = benchmark_results['corpora']['startup']['heavy_imports']
+    if len(heavy_imports) > 0:
+        sys.exit('Importing the scoring modules imports ' + ', '.join(heavy_imports) + '.')
+
+    # compare to an earlier run
+    if compare_file is not None:
+        with open(compare_file, 'r') as content_file:
+            earlier_results = json.load(content_file)
+        regressions = 0
+        for corpus_name, stage_name, old, new, regressed in compare_benchmarks(earlier_results, benchmark_results):
+            change = 0 if old == 0 else 100 * (new - old) / old
+            print(('REGRESSION ' if regressed else '') + corpus_name + ' ' + stage_name + ': ' + str(round(old, 4)) +
+                  ' s -> ' + str(round(new, 4)) + ' s (' + str(round(change, 1)) + '%)')
+            regressions += regressed
+        if regressions > 0:
+            sys.exit(str(regressions) + ' stage(s) regressed.')
@@ -0,0 +1,176 @@
+__author__ = 'zweiss'
+
+import codecs
+import io
+import mmap
+import os
+
+# line separating the documents of a corpus file if no other delimiter is given
+DEFAULT_DELIMITER = '<DOC>'
+
+# maximal size of the byte ranges a corpus file is split into, see CorpusReader.get_byte_ranges
+MAX_RANGE_SIZE = 64 * 1024 * 1024
+
+
+class CorpusReader:
+    """
+    Reads a single corpus file of many documents separated by delimiter lines, i.e. lines consisting of nothing but
+    the delimiter. The file is memory mapped, so document boundaries are found without reading the file into memory
+    and documents are decoded chunk by chunk from views into the mapping. The newline of the line before a delimiter
+    line belongs to the preceding document, empty documents are skipped.
+
+    A document is named <corpus file>@<byte offset of its start>, which does not depend on how the file is split into
+    byte ranges, see get_byte_ranges
+    """
+
+    def __init__(self, corpus_file, delimiter=DEFAULT_DELIMITER, encoding='utf-8'):
+        """
+        Opens and maps the corpus file
+        :param corpus_file: corpus file
+        :param delimiter: content of the lines separating the documents
+        :param encoding: encoding of the corpus file
+        """
+
+        if delimiter == '' or '\n' in delimiter:
+            raise ValueError('The delimiter has to be a non-empty single line')
+        self.corpus_file = corpus_file
+        self.delimiter = delimiter.encode(encoding)
+        self.encoding = encoding
+        self.file = open(corpus_file, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # empty files cannot be mapped
+        self.map = None if self.size == 0 else mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_delimiters(self, start=0):
+        """
+        Finds the delimiter lines starting at or after a byte offset
+        :param start: byte offset the search starts at
+        :return: generator of tuples of the byte offset of a delimiter line and of the line following it
+        """
+
+        if self.map is None:
+            return
+
+        # a delimiter line at the very start of the file is not preceded by a newline
+        if start == 0:
+            next_start = self.get_delimiter_end(0)
+            if next_start is not None:
+                yield 0, next_start
+
+        pattern = b'\n' + self.delimiter
+        position = self.map.find(pattern, max(start - 1, 0))
+        while position != -1:
+            next_start = self.get_delimiter_end(position + 1)
+            if next_start is not None:
+                yield position + 1, next_start
+            position = self.map.find(pattern, position + 1)
+
+    def get_delimiter_end(self, line_start):
+        """
+        Checks whether a line is a delimiter line
+        :param line_start: byte offset of the start of the line
+        :return: byte offset of the line following the delimiter line, None if the line is no delimiter line
+        """
+
+        line_end = line_start + len(self.delimiter)
+        if self.map[line_start:line_end] != self.delimiter:
+            return None
+        if line_end == self.size:
+            return line_end
+        if self.map[line_end:line_end + 1] == b'\n':
+            return line_end + 1
+        if self.map[line_end:line_end + 2] == b'\r\n':
+            return line_end + 2
+        return None
+
+    def iter_documents(self, start=0, end=None):
+        """
+        Finds the documents starting within a byte range. A document starting within the range is returned
+        completely, even if it ends after the range
+        :param start: first byte offset of the range
+        :param end: byte offset after the range, the end of the file if None
+        :return: generator of tuples of document name, byte offset of its start and byte offset after its end
+        """
+
+        if end is None:
+            end = self.size
+        document_start = 0 if start == 0 else None
+        # delimiter lines starting shortly before the range may end within it
+        for line_start, next_start in self.iter_delimiters(max(start - len(self.delimiter) - 2, 0)):
+            if document_start is not None and line_start > document_start:
+                yield self.get_name(document_start), document_start, line_start
+            document_start = None
+            if next_start >= end:
+                return
+            if next_start >= start:
+                document_start = next_start
+        if document_start is not None and document_start < self.size:
+            yield self.get_name(document_start), document_start, self.size
+
+    def iter_chunks(self, start, end, chunk_size=65536):
+        """
+        Decodes a document in chunks, newlines are translated like in files opened for reading text
+        :param start: byte offset of the start of the document
+        :param end: byte offset after the end of the document
+        :param chunk_size: number of bytes per chunk
+        :return: generator of chunks
+        """
+
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(self.encoding)(), translate=True)
+        for position in range(start, end, chunk_size):
+            chunk_end = min(position + chunk_size, end)
+            # the views are released before the chunk is yielded, a suspended generator would keep the map from
+            # being closed
+            with memoryview(self.map) as view, view[position:chunk_end] as chunk_view:
+                chunk = decoder.decode(chunk_view, final=chunk_end == end)
+            if chunk:
+                yield chunk
+
+    def get_text(self, start, end):
+        """
+        Decodes a whole document
+        :param start: byte offset of the start of the document
+        :param end: byte offset after the end of the document
+        :return: text of the document
+        """
+
+        return ''.join(self.iter_chunks(start, end))
+
+    def get_name(self, start):
+        """
+        Returns the name of a document
+        :param start: byte offset of the start of the document
+        :return: name of the document
+        """
+
+        return self.corpus_file + '@' + str(start)
+
+    def get_byte_ranges(self, num_ranges=1, max_range_size=MAX_RANGE_SIZE):
+        """
+        Splits the corpus file into byte ranges of about the same size. Every document starts in exactly one range,
+        so the ranges can be read by several processes, see iter_documents. Large files are split into more ranges,
+        so that no range is larger than max_range_size and the results of a range are not held for a whole file
+        :param num_ranges: minimal number of ranges
+        :param max_range_size: maximal size of a range in bytes
+        :return: list of tuples of first byte offset and byte offset after the range
+        """
+
+        num_ranges = max(num_ranges, -(-self.size // max_range_size))
+        num_ranges = max(min(num_ranges, self.size), 1)
+        return [(i * self.size // num_ranges, (i + 1) * self.size // num_ranges) for i in range(num_ranges)]
+
+    def close(self):
+        """
+        Unmaps and closes the corpus file
+        """
+
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
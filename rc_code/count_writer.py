@@ -0,0 +1,384 @@
+__author__ = 'zweiss'
+
+import atexit
+import os
+import queue
+import shutil
+import threading
+from collections import OrderedDict
+
+# lists of what was counted: category, directory and file suffix of the per document layout
+CATEGORIES = [('sentences', 'sentences/', '.sentences.meta'),
+              ('tokens', 'tokens/', '.tokens.meta'),
+              ('punct_colon', 'punct_colon/', '.punct_colon.meta'),
+              ('punctuation', 'punctuation/', '.punct.meta'),
+              ('word', 'word/', '.word.meta'),
+              ('syll3plus', 'syll3plus/', '.syll3plus.meta'),
+              ('syll1', 'syll1/', '.syll1.meta'),
+              ('syll2less', 'syll2less/', '.syll2less.meta'),
+              ('char6plus', 'char6plus/', '.char6plus.meta')]
+
+# directory and file suffix of every category
+LAYOUT = {category: (sub_directory, suffix) for category, sub_directory, suffix in CATEGORIES}
+
+# number of entries of a list collected before they are written, see CountListObserver
+FLUSH_SIZE = 65536
+
+
+class CountWriter:
+    """
+    Writes the lists of what was counted for a document, see counts.get_and_save_counts. Lists are handed over in
+    parts of many entries, see CountListObserver, each part is written with a single large write. Created directories
+    and the appended count files are cached over all documents and writing can be moved to a background thread, so
+    that it overlaps with counting.
+
+    Two layouts are supported: 'per_document' writes one file per list and document next to the document as well as
+    a counts/counts.csv per directory, 'consolidated' writes the lists of all documents to a single tab separated
+    dump file with the columns file, category, index, syllables and entry, and the counts to <dump file>.counts.csv
+    """
+
+    def __init__(self, layout='per_document', dump_file=None, background=False, buffer_size=1048576,
+                 queue_size=16, max_open_files=64):
+        """
+        Sets up the writer
+        :param layout: either 'per_document' or 'consolidated'
+        :param dump_file: dump file of the consolidated layout
+        :param background: writes in a background thread if set to true
+        :param buffer_size: size of the write buffers of the lists in bytes
+        :param queue_size: maximal number of parts of lists and documents waiting for the background thread
+        :param max_open_files: maximal number of count files of the per document layout kept open, the least
+        recently used file is closed when another one is opened
+        """
+
+        if layout not in ('per_document', 'consolidated'):
+            raise ValueError('Unknown layout: ' + str(layout))
+        if layout == 'consolidated' and dump_file is None:
+            raise ValueError('The consolidated layout needs a dump file')
+        self.layout = layout
+        self.dump_file = dump_file
+        self.buffer_size = buffer_size
+        self.max_open_files = max_open_files
+        self.created_directories = set()
+        self.count_files = OrderedDict()
+        self.document = None
+        self.list_files = {}
+        self.dump = None
+        self.dump_counts = None
+        self.count_keys = None
+
+        self.queue = None
+        self.thread = None
+        self.error = None
+        if background:
+            self.queue = queue.Queue(queue_size)
+            self.thread = threading.Thread(target=self.write_queued, daemon=True)
+            self.thread.start()
+
+    def write_entries(self, input_file, category, entries):
+        """
+        Writes a part of a list of what was counted for a document, the parts of a list are written in order
+        :param input_file: document the list belongs to
+        :param category: category of the list, see CATEGORIES
+        :param entries: list of tuples of index, number of syllables or None and entry
+        """
+
+        self.submit(self.write_document_entries, input_file, category, entries)
+
+    def end_document(self, input_file, count_dict):
+        """
+        Writes the counts of a document after all parts of its lists
+        :param input_file: document the counts belong to
+        :param count_dict: dictionary of counts of the document
+        """
+
+        self.submit(self.write_document_counts, input_file, dict(count_dict))
+
+    def submit(self, function, *args):
+        """
+        Calls a writing function, in the background thread if there is one
+        :param function: writing function
+        :param args: arguments of the function
+        """
+
+        if self.queue is not None:
+            self.raise_background_error()
+            self.queue.put((function, args))
+        else:
+            function(*args)
+
+    def write_queued(self):
+        """
+        Calls the writing functions queued by submit until close puts None into the queue
+        """
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    function, args = item
+                    function(*args)
+                except Exception as e:
+                    # keep consuming the queue, so that submit does not block, and report the error in this thread
+                    self.error = e
+
+    def raise_background_error(self):
+        """
+        Raises the error that stopped the background thread from writing, if any
+        """
+
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def write_document_entries(self, input_file, category, entries):
+        """
+        Writes a part of a list of what was counted for a document in the layout of the writer
+        :param input_file: document the list belongs to
+        :param category: category of the list, see CATEGORIES
+        :param entries: list of tuples of index, number of syllables or None and entry
+        """
+
+        if self.layout == 'per_document':
+            lines = []
+            for index, num_syllables, entry in entries:
+                if num_syllables is None:
+                    lines.append(str(index) + ": " + entry + "\n\n")
+                else:
+                    lines.append(str(index) + " (" + str(num_syllables) + "): " + entry + "\n\n")
+            self.get_list_file(input_file, category).write(''.join(lines))
+
+        else:
+            self.open_dump()
+            lines = []
+            for index, num_syllables, entry in entries:
+                lines.append(input_file + '\t' + category + '\t' + str(index) + '\t' +
+                             ('' if num_syllables is None else str(num_syllables)) + '\t' + entry + '\n')
+            self.dump.write(''.join(lines))
+
+    def write_document_counts(self, input_file, count_dict):
+        """
+        Writes the counts of a document in the layout of the writer and closes the files of its lists
+        :param input_file: document the counts belong to
+        :param count_dict: dictionary of counts of the document
+        """
+
+        directory = input_file[0:input_file.rfind("/")+1]
+        orig_file = input_file[input_file.rfind("/")+1:]
+
+        if self.layout == 'per_document':
+            # every list has a file, also if nothing was counted
+            for category, sub_directory, suffix in CATEGORIES:
+                self.get_list_file(input_file, category)
+            self.close_list_files()
+
+            # every line is flushed at once, so that lines of pool workers appending to the same file are not
+            # interleaved
+            out = self.get_count_file(directory)
+            values = [str(count_dict[key]) + "," for key in sorted(count_dict.keys())]
+            out.write(orig_file + "," + ''.join(values) + "\n")
+            out.flush()
+
+        else:
+            self.open_dump()
+            if self.count_keys is None:
+                self.count_keys = sorted(count_dict.keys())
+                self.dump_counts.write('file,' + ','.join(self.count_keys) + '\n')
+            values = [',' + str(count_dict[key]) for key in self.count_keys]
+            self.dump_counts.write(input_file + ''.join(values) + '\n')
+
+    def get_list_file(self, input_file, category):
+        """
+        Returns the file of a list of a document in the per document layout, it is opened on the first call and
+        closed when the counts of the document are written
+        :param input_file: document the list belongs to
+        :param category: category of the list, see CATEGORIES
+        :return: file stream
+        """
+
+        if input_file != self.document:
+            self.close_list_files()
+            self.document = input_file
+        if category not in self.list_files:
+            directory = input_file[0:input_file.rfind("/")+1]
+            orig_file = input_file[input_file.rfind("/")+1:]
+            sub_directory, suffix = LAYOUT[category]
+            self.list_files[category] = self.make_and_open(directory + sub_directory, orig_file + suffix, 'w')
+        return self.list_files[category]
+
+    def close_list_files(self):
+        """
+        Closes the files of the lists of the current document
+        """
+
+        for out in self.list_files.values():
+            out.close()
+        self.list_files = {}
+        self.document = None
+
+    def get_count_file(self, directory):
+        """
+        Returns the count file of a directory in the per document layout, opened for appending. At most
+        max_open_files count files are kept open, e.g. for runs over many directories with a limit of open files
+        :param directory: directory of the documents
+        :return: file stream
+        """
+
+        count_file = directory + "counts/counts.csv"
+        out = self.count_files.pop(count_file, None)
+        if out is None:
+            while len(self.count_files) >= max(self.max_open_files, 1):
+                self.count_files.popitem(last=False)[1].close()
+            # lines are flushed one by one, a large buffer would only take memory
+            out = self.make_and_open(directory + "counts/", "counts.csv", 'a', -1)
+        self.count_files[count_file] = out
+        return out
+
+    def open_dump(self):
+        """
+        Opens the dump file and its count file of the consolidated layout on the first call
+        """
+
+        if self.dump is None:
+            self.dump = open(self.dump_file, 'w', buffering=self.buffer_size)
+            self.dump.write('file\tcategory\tindex\tsyllables\tentry\n')
+            self.dump_counts = open(self.dump_file + '.counts.csv', 'w', buffering=self.buffer_size)
+
+    def make_and_open(self, directory, file, option, buffer_size=None):
+        """
+        Creates a directory if necessary and opens a file with a large write buffer
+        :param directory: directory
+        :param file: file name
+        :param option: writing or appending
+        :param buffer_size: size of the write buffer in bytes, the buffer size of the writer if None
+        :return: file stream
+        """
+
+        if directory not in self.created_directories:
+            os.makedirs(directory, exist_ok=True)
+            self.created_directories.add(directory)
+        return open(directory + file, option, buffering=self.buffer_size if buffer_size is None else buffer_size)
+
+    def close(self):
+        """
+        Writes all queued documents and closes all files
+        """
+
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        self.close_list_files()
+        for count_file in self.count_files.values():
+            count_file.close()
+        self.count_files = OrderedDict()
+        if self.dump is not None:
+            self.dump.close()
+            self.dump_counts.close()
+            self.dump = None
+            self.dump_counts = None
+        self.raise_background_error()
+
+
+class CountListObserver:
+    """
+    Observer of counts.CountingEngine collecting the lists of what was counted for a document and handing them to the
+    count writer of this process. A list is handed over whenever it reaches flush_size entries and when the document
+    is counted, so memory does not grow with the size of the document
+    """
+
+    def __init__(self, flush_size=FLUSH_SIZE):
+        """
+        Sets up the observer
+        :param flush_size: number of entries of a list after which they are handed to the count writer
+        """
+
+        self.flush_size = flush_size
+        self.name = None
+        self.lists = None
+
+    def start_document(self, name):
+        """
+        Starts collecting the lists of a document
+        :param name: document the lists belong to
+        """
+
+        self.name = name
+        self.lists = {category: [] for category, sub_directory, suffix in CATEGORIES}
+
+    def add(self, category, index, num_syllables, unit):
+        """
+        Adds a counted unit to its list
+        :param category: category of the unit
+        :param index: number of the unit within its category
+        :param num_syllables: number of syllables for syllable categories, None otherwise
+        :param unit: counted unit
+        """
+
+        entries = self.lists[category]
+        entries.append((index, num_syllables, unit))
+        if len(entries) >= self.flush_size:
+            get_count_writer().write_entries(self.name, category, entries)
+            self.lists[category] = []
+
+    def end_document(self, name, count_dict):
+        """
+        Hands the rest of the lists and the counts of a document to the count writer
+        :param name: document the lists belong to
+        :param count_dict: dictionary of counts of the document
+        """
+
+        count_writer = get_count_writer()
+        for category, sub_directory, suffix in CATEGORIES:
+            if len(self.lists[category]) > 0:
+                count_writer.write_entries(name, category, self.lists[category])
+        count_writer.end_document(name, count_dict)
+        self.name = None
+        self.lists = None
+
+
+# writer shared by all calls within this process, see get_count_writer
+shared_count_writer = None
+
+
+def get_count_writer():
+    """
+    Returns the count writer of this process, a synchronous writer in the per document layout is created on the
+    first call
+    :return: CountWriter
+    """
+
+    global shared_count_writer
+    if shared_count_writer is None:
+        shared_count_writer = CountWriter()
+        atexit.register(shared_count_writer.close)
+    return shared_count_writer
+
+
+def set_count_writer(count_writer):
+    """
+    Replaces the count writer of this process
+    :param count_writer: CountWriter used by all following calls of get_count_writer
+    """
+
+    global shared_count_writer
+    shared_count_writer = count_writer
+
+
+def merge_dumps(dump_files, dump_file):
+    """
+    Concatenates dump files of the consolidated layout written by several processes, e.g. pool workers
+    :param dump_files: dump files to be merged, their count files are merged as well
+    :param dump_file: dump file the merged dumps are written to
+    """
+
+    for suffix in ('', '.counts.csv'):
+        with open(dump_file + suffix, 'w') as out:
+            for i, part_file in enumerate(dump_files):
+                with open(part_file + suffix, 'r') as part:
+                    header = part.readline()
+                    if i == 0:
+                        out.write(header)
+                    shutil.copyfileobj(part, out)
@@ -1,185 +1,416 @@
 __author__ = 'zweiss'
 
-from os import path
-from os import makedirs
+from array import array
+from collections import Counter
+from collections import defaultdict
 
-from nlp import get_num_syllables
-from nlp import get_punctuation_list
+from count_writer import CountListObserver
+from nlp import get_syllable_cache
+from nlp import get_punctuation_set
+from word_index import get_word_index
+
+# punctuation marks counted as periods and colons
+PERIODS_AND_COLONS = frozenset(['.', ':'])
+
+# count of the units of every category of count_writer.CATEGORIES a token can be classified in, see TokenClassifier;
+# punctuation marks are only listed, not counted apart from tokens
+CATEGORY_COUNTS = {'punctuation': None, 'punct_colon': 'num_periods_and_colons', 'word': 'num_tokens_no_punct',
+                   'syll3plus': 'num_words_3_or_more_syllables', 'syll2less': 'num_words_2_or_less_syllables',
+                   'syll1': 'num_words_1_syllable', 'char6plus': 'num_words_6_or_more_characters'}
+
+# categories whose units are listed with their number of syllables
+SYLLABLE_CATEGORIES = frozenset(['syll3plus', 'syll2less', 'syll1'])
+
+# categories whose units are numbered like those of another category
+NUMBERED_LIKE = {'punct_colon': 'punctuation'}
+
+# maximal number of distinct tokens of a document counted before they are classified, see CountingEngine.count
+MAX_DISTINCT_TOKENS = 100000
+
+
+class Counts:
+    """
+    Counts of a document, kept in fixed slots instead of a dictionary. The slot names are the names of the count file
+    (./counts.txt) without the COUNTS_ prefix
+    """
+
+    __slots__ = ('num_sentences', 'num_tokens', 'num_tokens_no_punct', 'num_syllables', 'num_characters',
+                 'num_words_3_or_more_syllables', 'num_words_1_syllable', 'num_words_2_or_less_syllables',
+                 'num_words_6_or_more_characters', 'num_periods_and_colons')
+
+    def __init__(self):
+        """
+        Sets up all counts initialized to zero
+        """
+
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def to_dict(self, schema=__slots__):
+        """
+        Returns the counts as count dictionary
+        :param schema: names of the counts to be returned
+        :return: dictionary of counts with COUNTS_ prefixed keys
+        """
+
+        return {'COUNTS_' + name: getattr(self, name) for name in schema}
+
+    def add(self, categories, num_syllables, num_characters, num_units=1):
+        """
+        Adds tokens classified by a TokenClassifier to the counts
+        :param categories: categories of the tokens
+        :param num_syllables: number of syllables of each token
+        :param num_characters: number of characters of each token
+        :param num_units: number of tokens
+        """
+
+        self.num_tokens += num_units
+        self.num_syllables += num_syllables * num_units
+        self.num_characters += num_characters * num_units
+        for category in categories:
+            count_name = CATEGORY_COUNTS[category]
+            if count_name is not None:
+                setattr(self, count_name, getattr(self, count_name) + num_units)
+
+
+class TokenClassifier:
+    """
+    Classifies tokens into the categories they are counted in, see CATEGORY_COUNTS: punctuation marks, periods and
+    colons among them, words and the syllable and character categories of words, see get_word_categories. This is the
+    only place tokens are classified, both for counting and for the lists of what was counted. The categories of words
+    are memoized per number of syllables and characters
+    """
+
+    def __init__(self, punctuation=None, get_num_syllables=None, word_categories=None):
+        """
+        Sets up the classifier
+        :param punctuation: set of punctuation marks, those of nlp.get_punctuation_set if None
+        :param get_num_syllables: function counting the syllables of a word, that of the syllable cache of this process
+        if None
+        :param word_categories: dictionary memoizing the categories of words, may be shared by several classifiers
+        """
+
+        self.punctuation_categories = get_punctuation_categories(
+            get_punctuation_set() if punctuation is None else punctuation)
+        self.get_num_syllables = get_syllable_cache().get_num_syllables if get_num_syllables is None else \
+            get_num_syllables
+        self.word_categories = {} if word_categories is None else word_categories
+
+    def classify(self, token):
+        """
+        Classifies a token
+        :param token: token to be classified
+        :return: tuple of the categories of the token, its number of syllables and its number of characters; both
+        numbers are 0 for punctuation marks
+        """
+
+        categories = self.punctuation_categories.get(token)
+        if categories is not None:
+            return categories, 0, 0
+        num_syllables = self.get_num_syllables(token)
+        num_characters = len(token)
+        categories = self.word_categories.get((num_syllables, num_characters))
+        if categories is None:
+            categories = ('word',) + tuple(category for category, is_member
+                                           in get_word_categories(num_syllables, num_characters).items() if is_member)
+            self.word_categories[(num_syllables, num_characters)] = categories
+        return categories, num_syllables, num_characters
+
+
+class CountingEngine:
+    """
+    Collects the counts of tokenized sentences. The count file is parsed once when the engine is created. Tokens are
+    classified by a TokenClassifier and observers, if there are any, are notified of every counted unit, see
+    count_writer.CountListObserver
+    """
+
+    def __init__(self, count_file='counts.txt', observers=None):
+        """
+        Sets up the engine
+        :param count_file: file containing the counts
+        :param observers: list of observers notified of every counted unit
+        """
+
+        self.schema = get_count_schema(count_file)
+        self.observers = [] if observers is None else list(observers)
+        self.word_categories = {}
+
+    def get_counts(self, sentences, name=None):
+        """
+        Collects the counts of a document
+        :param sentences: iterable of tokenized sentences
+        :param name: name of the document passed to the observers
+        :return: dictionary of counts
+        """
+
+        return self.count(sentences, name).to_dict(self.schema)
+
+    def count(self, sentences, name=None):
+        """
+        Collects the counts of a document. Without observers, the tokens of the document are counted per distinct
+        token and every distinct token is classified once; the distinct tokens are added to the counts whenever there
+        are more than MAX_DISTINCT_TOKENS of them, so memory stays bounded also for long streamed documents
+        :param sentences: iterable of tokenized sentences
+        :param name: name of the document passed to the observers
+        :return: Counts
+        """
+
+        if len(self.observers) > 0:
+            return self.count_and_notify(sentences, name)
+
+        classify = TokenClassifier(word_categories=self.word_categories).classify
+        counts = Counts()
+        token_counts = Counter()
+        for sentence in sentences:
+            counts.num_sentences += 1
+            token_counts.update(sentence)
+            if len(token_counts) > MAX_DISTINCT_TOKENS:
+                for token, num_units in token_counts.items():
+                    counts.add(*classify(token), num_units)
+                token_counts.clear()
+        for token, num_units in token_counts.items():
+            counts.add(*classify(token), num_units)
+        return counts
+
+    def count_and_notify(self, sentences, name=None):
+        """
+        Collects the counts of a document and notifies the observers of every counted unit in the order of the
+        document. Units are numbered per category, periods and colons are numbered like all punctuation marks
+        :param sentences: iterable of tokenized sentences
+        :param name: name of the document passed to the observers
+        :return: Counts
+        """
+
+        classify = TokenClassifier(word_categories=self.word_categories).classify
+        notify = self.notify
+        counts = Counts()
+        indices = dict.fromkeys(CATEGORY_COUNTS, 0)
+
+        for observer in self.observers:
+            observer.start_document(name)
+
+        for sentence in sentences:
+            counts.num_sentences += 1
+            notify('sentences', counts.num_sentences, None, str(sentence))
+
+            for token in sentence:
+                categories, num_syllables, num_characters = classify(token)
+                counts.add(categories, num_syllables, num_characters)
+                notify('tokens', counts.num_tokens, None, token)
+                for category in categories:
+                    indices[category] += 1
+                    notify(category, indices[NUMBERED_LIKE.get(category, category)],
+                           num_syllables if category in SYLLABLE_CATEGORIES else None, token)
+
+        count_dict = counts.to_dict(self.schema)
+        for observer in self.observers:
+            observer.end_document(name, count_dict)
+
+        return counts
+
+    def get_counts_batch(self, documents):
+        """
+        Collects the counts of a batch of documents at once. Tokens are mapped to ids of a vocabulary shared by the
+        batch, the syllables and characters are counted once per vocabulary entry and summed per document with numpy.
+        Observers are not notified, as single units are never visited. The vocabulary is looked up in the word index
+        of this process if there is one, see word_index.set_word_index. Needs numpy
+        :param documents: iterable of documents, each an iterable of tokenized sentences
+        :return: list of dictionaries of counts, one per document
+        """
+
+        import numpy as np
+
+        # map all tokens of the batch to vocabulary ids, new tokens get the next free id
+        vocabulary = defaultdict()
+        vocabulary.default_factory = vocabulary.__len__
+        get_id = vocabulary.__getitem__
+        token_ids = array('q')
+        num_sentences = []
+        num_tokens = []
+        for document in documents:
+            document_sentences = document_tokens = 0
+            for sentence in document:
+                document_sentences += 1
+                document_tokens += len(sentence)
+                token_ids.extend(map(get_id, sentence))
+            num_sentences.append(document_sentences)
+            num_tokens.append(document_tokens)
+        if len(num_tokens) == 0:
+            return []
+
+        # classify every vocabulary entry once, words with the word index of this process if there is one
+        tokens = list(vocabulary)
+        word_index = get_word_index()
+        if word_index is None:
+            classify = TokenClassifier(word_categories=self.word_categories).classify
+            classes = [classify(token) for token in tokens]
+            is_word = np.fromiter(('word' in categories for categories, s, c in classes), bool, len(tokens))
+            is_period_or_colon = np.fromiter(('punct_colon' in categories for categories, s, c in classes), bool,
+                                             len(tokens))
+            syllables = np.fromiter((num_syllables for c, num_syllables, n in classes), np.int64, len(tokens))
+            characters = np.fromiter((num_characters for c, s, num_characters in classes), np.int64, len(tokens))
+        else:
+            punctuation_categories = get_punctuation_categories(get_punctuation_set())
+            is_word = np.fromiter((token not in punctuation_categories for token in tokens), bool, len(tokens))
+            is_period_or_colon = np.fromiter(('punct_colon' in punctuation_categories.get(token, ())
+                                              for token in tokens), bool, len(tokens))
+            words = np.flatnonzero(is_word)
+            syllables = np.zeros(len(tokens), dtype=np.int64)
+            characters = np.zeros(len(tokens), dtype=np.int64)
+            syllables[words], characters[words] = word_index.lookup([tokens[i] for i in words.tolist()])
+
+        # punctuation marks have neither syllables nor characters, so they are in none of the word categories
+        vocabulary_counts = {'num_syllables': syllables, 'num_characters': characters}
+        category_members = get_word_categories(syllables, characters)
+        category_members.update({'word': is_word, 'punct_colon': is_period_or_colon})
+        for category, is_member in category_members.items():
+            vocabulary_counts[CATEGORY_COUNTS[category]] = is_member
+
+        # sum the counts of the tokens per document; sums of integer weights are exact below 2 ** 53
+        ids = np.frombuffer(token_ids, dtype=np.int64)
+        document_ids = np.repeat(np.arange(len(num_tokens)), num_tokens)
+        document_counts = {'num_sentences': num_sentences, 'num_tokens': num_tokens}
+        for name, counts in vocabulary_counts.items():
+            document_counts[name] = np.bincount(document_ids, weights=counts[ids],
+                                                minlength=len(num_tokens)).astype(np.int64).tolist()
+
+        count_dicts = []
+        for d in range(len(num_tokens)):
+            counts = Counts()
+            for name, values in document_counts.items():
+                setattr(counts, name, values[d])
+            count_dicts.append(counts.to_dict(self.schema))
+        return count_dicts
+
+    def notify(self, category, index, num_syllables, unit):
+        """
+        Notifies all observers of a counted unit
+        :param category: category of the unit, see count_writer.CATEGORIES
+        :param index: number of the unit within its category
+        :param num_syllables: number of syllables for syllable categories, None otherwise
+        :param unit: counted unit
+        """
+
+        for observer in self.observers:
+            observer.add(category, index, num_syllables, unit)
+
+
+def get_word_categories(num_syllables, num_characters):
+    """
+    Returns the syllable and character categories of words. This is the only definition of the syllable and character
+    thresholds, it works on the numbers of a single word as well as on numpy arrays of the numbers of many words, see
+    TokenClassifier and CountingEngine.get_counts_batch
+    :param num_syllables: number of syllables of the word
+    :param num_characters: number of characters of the word
+    :return: dictionary of the categories syll3plus, syll2less, syll1 and char6plus and whether the word belongs to them
+    """
+
+    return {'syll3plus': num_syllables > 2,
+            'syll2less': (num_syllables > 0) & (num_syllables <= 2),
+            'syll1': num_syllables == 1,
+            'char6plus': num_characters > 5}
+
+
+def get_punctuation_categories(punctuation):
+    """
+    Returns the categories of punctuation marks, periods and colons are counted apart from all punctuation marks
+    :param punctuation: set of punctuation marks
+    :return: dictionary of every punctuation mark and its tuple of categories
+    """
+
+    return {mark: ('punctuation', 'punct_colon') if mark in PERIODS_AND_COLONS else ('punctuation',)
+            for mark in punctuation}
+
+
+# engines shared by all calls within this process, see get_engine
+engines = {}
+
+
+def get_engine(count_file='counts.txt', save_counts=False):
+    """
+    Returns a counting engine of this process, it is created on the first call
+    :param count_file: file containing the counts
+    :param save_counts: the engine saves lists of what was counted if set to true
+    :return: CountingEngine
+    """
+
+    key = (count_file, save_counts)
+    if key not in engines:
+        engines[key] = CountingEngine(count_file, [CountListObserver()] if save_counts else None)
+    return engines[key]
 
 
 def get_and_save_counts(tokenized_sentences, prefix, count_file='counts.txt'):
     """
-    Collects the counts given in the count file (./counts.txt)
-    :param tokenized_sentences: sentences
+    Collects the counts given in the count file (./counts.txt) and saves lists of what was counted with the count
+    writer of this process, see count_writer.CountWriter
+    :param tokenized_sentences: iterable of tokenized sentences
+    :param prefix: document the counts belong to
     :param count_file: file containing the counts
     :return: dictionary of counts
     """
 
-    count_dict = initialize_counts(count_file)
-    punctuation = get_punctuation_list()
-
-    # get number of sentences
-    count_dict['num_sentences'] = len(tokenized_sentences)
-
-    # if a prefix is given, save counts to separate files
-    directory = prefix[0:prefix.rfind("/")+1]
-    orig_file = prefix[prefix.rfind("/")+1:]
-    out_sent = make_and_open(directory+"sentences/", orig_file+".sentences.meta", 'w')
-    out_tokens = make_and_open(directory+"tokens/", orig_file+".tokens.meta", 'w')
-    out_punct_colon = make_and_open(directory+"punct_colon/", orig_file+".punct_colon.meta", 'w')
-    out_punct = make_and_open(directory+"punctuation/", orig_file+".punct.meta", 'w')
-    out_word = make_and_open(directory+"word/", orig_file+".word.meta", "w")
-    out_syll3 = make_and_open(directory+"syll3plus/", orig_file+".syll3plus.meta", "w")
-    out_syll1 = make_and_open(directory+"syll1/", orig_file+".syll1.meta", "w")
-    out_syll2 = make_and_open(directory+"syll2less/", orig_file+".syll2less.meta", "w")
-    out_char6 = make_and_open(directory+"char6plus/", orig_file+".char6plus.meta", "w")
-    c_sent = c_tok = c_punct = c_punct_colon = c_word = c_syll3 = c_syll1 = c_syll2 = c_char6 = 0
-
-    for sentence in tokenized_sentences:
-        c_sent += 1
-        out_sent.write(str(c_sent) + ": " + str(sentence) + "\n\n")
-
-        # increase number of tokens
-        count_dict['COUNTS_num_tokens'] += len(sentence)
-
-        for token in sentence:
-            c_tok += 1
-            out_tokens.write(str(c_tok) + ": " + token + "\n\n")
-
-            # punctuation counts
-            if token in punctuation:
-                c_punct += 1
-                out_punct.write(str(c_punct) + ": " + token + "\n\n")
-                if token == '.' or token == ':':
-                    count_dict['COUNTS_num_periods_and_colons'] += 1
-                    c_punct_colon += 1
-                    out_punct_colon.write(str(c_punct) + ": " + token + "\n\n")
-
-            # word counts
-            else:
-                # increase number of words
-                count_dict['COUNTS_num_tokens_no_punct'] += 1
-                c_word += 1
-                out_word.write(str(c_word) + ": " + token + "\n\n")
-
-                # syllable counts
-                num_syllables = get_num_syllables(token)
-                # increase total number of syllables
-                count_dict['COUNTS_num_syllables'] += num_syllables
-                # either 3 or more syllables
-                if num_syllables > 2:
-                    count_dict['COUNTS_num_words_3_or_more_syllables'] += 1
-                    c_syll3 += 1
-                    out_syll3.write(str(c_syll3) + " ("+str(num_syllables)+"): " + token + "\n\n")
-                # or 2 or less syllables
-                elif num_syllables > 0:
-                    count_dict['COUNTS_num_words_2_or_less_syllables'] += 1
-                    c_syll2 += 1
-                    out_syll2.write(str(c_syll2) + " ("+str(num_syllables)+"): " + token + "\n\n")
-                    # maybe only single syllable
-                    if num_syllables == 1:
-                        count_dict['COUNTS_num_words_1_syllable'] += 1
-                        c_syll1 += 1
-                        out_syll1.write(str(c_syll1) + " ("+str(num_syllables)+"): " + token + "\n\n")
-
-                # character counts
-                num_char = len(token)
-                # increase total number of characters
-                count_dict['COUNTS_num_characters'] += num_char
-                # maybe 6 or more characters
-                if num_char > 5:
-                    count_dict['COUNTS_num_words_6_or_more_characters'] += 1
-                    c_char6 += 1
-                    out_char6.write(str(c_char6) + ": " + token + "\n\n")
-
-    out_sent.close()
-    out_tokens.close()
-    out_punct.close()
-    out_punct_colon.close()
-    out_word.close()
-    out_syll1.close()
-    out_syll2.close()
-    out_syll3.close()
-    out_char6.close()
-
-    out_counts = make_and_open(directory+"counts/", "counts.csv", 'a')
-    out_counts.write(orig_file + ",")
-    for key in sorted(count_dict.keys()):
-        out_counts.write(str(count_dict[key]) + ",")
-    out_counts.write("\n")
-    out_counts.close()
-
-    return count_dict
-
-
-def make_and_open(directory, file, option):
-    """
-    Creates a file / directory if necessary and opens a file
-    :param directory: directory
-    :param file: file name
-    :param option: reading, appending, writing, etc.
-    :return: file stream
-    """
-
-    if not path.exists(directory):
-        makedirs(directory)
-    return open(directory+file, option)
+    return get_engine(count_file, save_counts=True).get_counts(tokenized_sentences, prefix)
 
 
 def get_counts(sentences, count_file='counts.txt'):
     """
     Collects the counts given in the count file (./counts.txt)
-    :param sentences: sentences
+    :param sentences: iterable of tokenized sentences
     :param count_file: file containing the counts
     :return: dictionary of counts
     """
 
-    count_dict = initialize_counts(count_file)
-    punctuation = get_punctuation_list()
+    return get_engine(count_file).get_counts(sentences)
+
 
-    # get number of sentences
-    count_dict['COUNTS_num_sentences'] = len(sentences)
+def get_counts_batch(documents, count_file='counts.txt'):
+    """
+    Collects the counts given in the count file (./counts.txt) for a batch of documents at once, see
+    CountingEngine.get_counts_batch
+    :param documents: iterable of documents, each an iterable of tokenized sentences
+    :param count_file: file containing the counts
+    :return: list of dictionaries of counts, one per document
+    """
 
-    for sentence in sentences:
+    return get_engine(count_file).get_counts_batch(documents)
 
-        # increase number of tokens
-        count_dict['COUNTS_num_tokens'] += len(sentence)
 
-        for token in sentence:
+def merge_counts(count_dicts):
+    """
+    Sums up count dictionaries, e.g. of all documents of a directory. Counts are plain sums, so merging is associative
+    and commutative and sums merged in several processes can be merged again. Features and formulae are ratios and
+    cannot be merged, they have to be calculated on the merged counts
+    :param count_dicts: iterable of dictionaries of counts, keys of features and formulae are ignored
+    :return: dictionary of summed counts
+    """
 
-            # punctuation counts
-            if token in punctuation:
-                if token == '.' or token == ':':
-                    count_dict['COUNTS_num_periods_and_colons'] += 1
+    merged = {}
+    for count_dict in count_dicts:
+        for key, value in count_dict.items():
+            if key.startswith('COUNTS_'):
+                merged[key] = merged.get(key, 0) + value
+    return merged
 
-            # word counts
-            else:
-                # increase number of words
-                count_dict['COUNTS_num_tokens_no_punct'] += 1
 
-                # syllable counts
-                num_syllables = get_num_syllables(token)
-                # increase total number of syllables
-                count_dict['COUNTS_num_syllables'] += num_syllables
-                # either 3 or more syllables
-                if num_syllables > 2:
-                    count_dict['COUNTS_num_words_3_or_more_syllables'] += 1
-                # or 2 or less syllables
-                elif num_syllables > 0:
-                    count_dict['COUNTS_num_words_2_or_less_syllables'] += 1
-                    # maybe only single syllable
-                    if num_syllables == 1:
-                        count_dict['COUNTS_num_words_1_syllable'] += 1
+def get_count_schema(count_file):
+    """
+    Reads the names of the counts from the count file
+    :param count_file: file containing all counts separated by lines
+    :return: tuple of count names without the COUNTS_ prefix
+    """
 
-                # character counts
-                num_char = len(token)
-                # increase total number of characters
-                count_dict['COUNTS_num_characters'] += num_char
-                # maybe 6 or more characters
-                if num_char > 5:
-                    count_dict['COUNTS_num_words_6_or_more_characters'] += 1
+    schema = []
+    file_reader = open(count_file, 'r')
+    for line in file_reader.readlines():
+        if line.strip() == '':
+            continue
+        if line.strip() not in Counts.__slots__:
+            raise ValueError('Unknown count in ' + count_file + ': ' + line.strip())
+        schema.append(line.strip())
+    file_reader.close()
 
-    return count_dict
+    return tuple(schema)
 
 
 def initialize_counts(count_file):
@@ -189,11 +420,4 @@ def initialize_counts(count_file):
     :return: dictionary with all counts from count_file as keys, initialized to zero
     """
 
-    count_dict = {}
-    # read count dictionary keys from count_file and initialize them with
-    file_reader = open(count_file, 'r')
-    for line in file_reader.readlines():
-        count_dict["COUNTS_" + line.strip()] = 0
-    file_reader.close()
-
-    return count_dict
+    return Counts().to_dict(get_count_schema(count_file))
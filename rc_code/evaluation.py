@@ -0,0 +1,95 @@
+__author__ = 'zweiss'
+
+# metrics of the evaluation, as named by sklearn's scoring parameter
+METRICS = ('f1_weighted', 'precision_weighted', 'recall_weighted')
+
+
+def get_folds(classes, num_folds=10):
+    """
+    Splits instances into stratified folds, like cross_val_score with cv=num_folds does for classifiers
+    :param classes: class of every instance
+    :param num_folds: number of folds
+    :return: list of tuples of train and test indices
+    """
+
+    import numpy as np
+    from sklearn.model_selection import StratifiedKFold
+
+    return list(StratifiedKFold(num_folds).split(np.zeros((len(classes), 1)), classes))
+
+
+def fit_fold(estimator, predictors, classes, train):
+    """
+    Fits a copy of an estimator on the training instances of a fold
+    :param estimator: sklearn estimator, it is not changed
+    :param predictors: predictor matrix of all instances
+    :param classes: class of every instance
+    :param train: indices of the training instances
+    :return: fitted estimator
+    """
+
+    from sklearn.base import clone
+
+    return clone(estimator).fit(predictors[train], classes[train])
+
+
+def score_fold(estimator, predictors, classes, train, test, metrics=METRICS, memory=None):
+    """
+    Fits an estimator on a fold and calculates all metrics from the same predictions of the test instances
+    :param estimator: sklearn estimator
+    :param predictors: predictor matrix of all instances
+    :param classes: class of every instance
+    :param train: indices of the training instances
+    :param test: indices of the test instances
+    :param metrics: metrics to be calculated, see METRICS
+    :param memory: joblib.Memory the fitted estimator is cached in, not cached if None
+    :return: dictionary of metrics with scores
+    """
+
+    from sklearn.metrics import f1_score
+    from sklearn.metrics import precision_score
+    from sklearn.metrics import recall_score
+
+    scorers = {'f1': f1_score, 'precision': precision_score, 'recall': recall_score}
+    fit = fit_fold if memory is None else memory.cache(fit_fold)
+    predictions = fit(estimator, predictors, classes, train).predict(predictors[test])
+    scores = {}
+    for metric in metrics:
+        name, average = metric.split('_')
+        scores[metric] = scorers[name](classes[test], predictions, average=average)
+    return scores
+
+
+def cross_validate(models, classes, num_folds=10, metrics=METRICS, n_jobs=-1, cache_dir=None):
+    """
+    Cross validates several models at once. Every model is fitted once per fold and all metrics are calculated from
+    its predictions, instead of fitting it once per metric as separate calls of cross_val_score do. The folds of all
+    models are fitted in parallel by joblib. If a cache directory is given, fitted models are stored there and reused
+    by later runs with the same estimator and data
+    :param models: dictionary of names with tuples of sklearn estimator and predictor matrix
+    :param classes: class of every instance
+    :param num_folds: number of folds, see get_folds
+    :param metrics: metrics to be calculated, see METRICS
+    :param n_jobs: number of parallel jobs, -1 uses all cores
+    :param cache_dir: directory the fitted models are cached in, not cached if None
+    :return: dictionary of metrics with dictionaries of model names with the list of scores per fold
+    """
+
+    import numpy as np
+    from joblib import Memory
+    from joblib import Parallel
+    from joblib import delayed
+
+    classes = np.asarray(classes)
+    folds = get_folds(classes, num_folds)
+    memory = None if cache_dir is None else Memory(cache_dir, verbose=0)
+    names = sorted(models.keys())
+    jobs = [delayed(score_fold)(models[name][0], np.asarray(models[name][1]), classes, train, test, metrics, memory)
+            for name in names for train, test in folds]
+    fold_scores = Parallel(n_jobs=n_jobs)(jobs)
+
+    results = {metric: {} for metric in metrics}
+    for i, name in enumerate(names):
+        for metric in metrics:
+            results[metric][name] = [scores[metric] for scores in fold_scores[i * num_folds:(i + 1) * num_folds]]
+    return results
@@ -1,5 +1,20 @@
 __author__ = 'zweiss'
 
+import sys
+
+# features as ratios of two counts, the feature is 0 where the denominator is 0; see get_features_batch
+FEATURE_RATIOS = [
+    ('FEAT_mean_sentence_length_in_words', 'COUNTS_num_tokens_no_punct', 'COUNTS_num_sentences'),
+    ('FEAT_mean_word_length_in_syllables', 'COUNTS_num_syllables', 'COUNTS_num_tokens_no_punct'),
+    ('FEAT_mean_word_length_in_characters', 'COUNTS_num_characters', 'COUNTS_num_tokens_no_punct'),
+    ('FEAT_avg_num_1_syllable_words', 'COUNTS_num_words_1_syllable', 'COUNTS_num_tokens_no_punct'),
+    ('FEAT_avg_num_3_or_more_syllable_words', 'COUNTS_num_words_3_or_more_syllables', 'COUNTS_num_tokens_no_punct'),
+    ('FEAT_avg_num_6_or_more_character_words', 'COUNTS_num_words_6_or_more_characters',
+     'COUNTS_num_tokens_no_punct'),
+    ('FEAT_sentence_word_ratio', 'COUNTS_num_sentences', 'COUNTS_num_tokens'),
+    ('FEAT_word_dot_ratio', 'COUNTS_num_tokens_no_punct', 'COUNTS_num_periods_and_colons')
+]
+
 
 def get_features(count_dict, feature_file = 'features.txt'):
     """
@@ -29,6 +44,47 @@ def get_features(count_dict, feature_file = 'features.txt'):
     }
 
 
+def get_features_batch(counts):
+    """
+    Calculates the features of many documents at once, e.g. to score stored counts without analysing the documents
+    again. Every feature is a vectorized numpy division of two count columns; where the denominator is 0 the feature
+    is 0, like in get_features. Counts below 2 ** 53 are converted to floats exactly, so the features are the same
+    values get_features returns for every document
+    :param counts: columnar counts with the COUNTS_ columns of counts.get_counts, e.g. a pandas DataFrame, a numpy
+    structured array or a dictionary of arrays
+    :return: dictionary of numpy arrays with the keys of get_features, or a pandas DataFrame sharing the index of
+    counts if counts is a DataFrame, see get_batch_result
+    """
+
+    import numpy as np
+
+    columns = {}
+    features = {}
+    for key, numerator, denominator in FEATURE_RATIOS:
+        for column in (numerator, denominator):
+            if column not in columns:
+                columns[column] = np.asarray(counts[column], dtype=np.float64)
+        divisor = columns[denominator]
+        features[key] = np.divide(columns[numerator], divisor, out=np.zeros(divisor.shape), where=divisor != 0)
+
+    return get_batch_result(features, counts)
+
+
+def get_batch_result(columns, batch):
+    """
+    Returns the result columns of a batch calculation in the form of its input. pandas is only used if the input is a
+    DataFrame, in which case it has been imported already
+    :param columns: dictionary of numpy arrays calculated on the batch
+    :param batch: columnar input of the calculation
+    :return: pandas DataFrame of the columns sharing the index of batch if batch is a DataFrame, the columns otherwise
+    """
+
+    pandas = sys.modules.get('pandas')
+    if pandas is not None and isinstance(batch, pandas.DataFrame):
+        return pandas.DataFrame(columns, index=batch.index)
+    return columns
+
+
 def get_avg_sentence_length_in_words(num_sentences, num_words):
     """
     Returns the average sentence length in words
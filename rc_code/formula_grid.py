@@ -0,0 +1,261 @@
+__author__ = 'zweiss'
+
+import hashlib
+import itertools
+import os
+
+import readability_formulae as rf
+from atomic_file import open_atomic
+
+# feature values the formulae are evaluated at to tell whether they changed, see get_formulae_key; distinct and
+# neither 0 nor 1, so that no term of a formula drops out
+PROBE_FEATURES = {feature: 1.5 + 0.25 * i for i, feature in enumerate(rf.FORMULA_FEATURES)}
+
+
+class FormulaGrid:
+    """
+    Readability formulae evaluated on a grid of feature values, e.g. mean sentence length against mean word length,
+    so that formulae can be looked up and inverted without evaluating them point by point. The grid is evaluated in
+    one vectorized pass of readability_formulae.get_formulae over sparse axes, so every surface only has the
+    dimensions of the axes its formula depends on. Features without an axis are held at fixed values.
+
+    Values between grid points are interpolated multilinearly, which is exact for the current formulae as they are
+    linear in the features
+    """
+
+    def __init__(self, axes, fixed=None, formulae=None, surfaces=None):
+        """
+        Evaluates the formulae on the grid
+        :param axes: list of tuples of feature, see readability_formulae.FORMULA_FEATURES, and strictly increasing
+        values of the feature
+        :param fixed: dictionary of the values of features without an axis, features neither on an axis nor fixed
+        are 0
+        :param formulae: keys of the formulae to be kept, see readability_formulae.get_formulae; all if None
+        :param surfaces: dictionary of formulae with surfaces evaluated before, e.g. loaded from a cache, see load
+        """
+
+        import numpy as np
+
+        self.features = [feature for feature, values in axes]
+        self.values = [np.asarray(values, dtype=np.float64) for feature, values in axes]
+        self.fixed = {} if fixed is None else dict(fixed)
+        for feature, values in zip(self.features, self.values):
+            if feature not in rf.FORMULA_FEATURES or feature in self.fixed:
+                raise ValueError('Invalid axis: ' + feature)
+            if values.ndim != 1 or len(values) < 2 or not np.all(np.diff(values) > 0):
+                raise ValueError('Values of axis ' + feature + ' have to be at least two increasing numbers')
+        if len(set(self.features)) != len(self.features):
+            raise ValueError('Every feature can only have one axis')
+
+        if surfaces is None:
+            # one sparse coordinate array per axis, so the formulae broadcast them to the axes they depend on
+            features = {feature: float(self.fixed.get(feature, 0)) for feature in rf.FORMULA_FEATURES}
+            features.update(zip(self.features, np.meshgrid(*self.values, indexing='ij', sparse=True)))
+            surfaces = rf.get_formulae(features)
+            shape = (1,) * len(self.features)
+            surfaces = {key: np.zeros(shape) + surface for key, surface in surfaces.items()
+                        if formulae is None or key in formulae}
+        self.surfaces = surfaces
+
+    def get_key(self):
+        """
+        Returns a key identifying the axes and fixed values of the grid and the formulae, see get_formulae_key
+        :return: hexadecimal hash
+        """
+
+        key = hashlib.sha1(get_formulae_key().encode('utf-8'))
+        for feature, values in zip(self.features, self.values):
+            key.update(feature.encode('utf-8'))
+            key.update(values.tobytes())
+        for feature in sorted(self.fixed.keys()):
+            key.update((feature + '=' + repr(float(self.fixed[feature]))).encode('utf-8'))
+        return key.hexdigest()
+
+    def get_surface(self, formula):
+        """
+        Returns the surface of a formula
+        :param formula: key of the formula
+        :return: numpy array with one dimension per axis, of length 1 for axes the formula does not depend on
+        """
+
+        if formula not in self.surfaces:
+            raise KeyError('Formula not on the grid: ' + formula)
+        return self.surfaces[formula]
+
+    def lookup(self, formula, point):
+        """
+        Interpolates a formula at one or many points
+        :param formula: key of the formula
+        :param point: dictionary of all axis features with values or arrays of values
+        :return: value or numpy array of values of the formula, nan for points outside the grid
+        """
+
+        import numpy as np
+
+        surface = self.get_surface(formula)
+        missing = [feature for feature in self.features if feature not in point]
+        if len(missing) > 0:
+            raise ValueError('Missing value of axis ' + ', '.join(missing))
+        coordinates = np.broadcast_arrays(*[np.asarray(point[feature], dtype=np.float64)
+                                            for feature in self.features])
+
+        # index of the grid cell and position within the cell along every axis the formula depends on
+        outside = np.zeros(coordinates[0].shape, dtype=bool)
+        cells = []
+        for axis, (values, x) in enumerate(zip(self.values, coordinates)):
+            outside |= (x < values[0]) | (x > values[-1]) | np.isnan(x)
+            if surface.shape[axis] == 1:
+                cells.append(None)
+                continue
+            i = np.clip(np.searchsorted(values, x, 'right') - 1, 0, len(values) - 2)
+            cells.append((i, (x - values[i]) / (values[i + 1] - values[i])))
+
+        # weighted sum of the values at the corners of the cells
+        result = np.zeros(coordinates[0].shape)
+        for corner in itertools.product((0, 1), repeat=sum(cell is not None for cell in cells)):
+            corner = iter(corner)
+            index = []
+            weight = 1.0
+            for cell in cells:
+                if cell is None:
+                    index.append(0)
+                    continue
+                i, t = cell
+                if next(corner):
+                    index.append(i + 1)
+                    weight = weight * t
+                else:
+                    index.append(i)
+                    weight = weight * (1 - t)
+            result += weight * surface[tuple(index)]
+        result[outside] = np.nan
+        return result[()] if result.ndim == 0 else result
+
+    def get_range(self, formula, feature, minimum=None, maximum=None, point=None):
+        """
+        Finds the values of a feature for which a formula stays within bounds while the other features are kept,
+        e.g. the maximal mean sentence length with a Flesch Reading Ease of at least 60 at a given word length. The
+        bounds are interpolated between grid points. If the formula is not monotonic along the feature, the outermost
+        values within bounds are returned
+        :param formula: key of the formula
+        :param feature: axis feature to be solved for
+        :param minimum: lowest allowed value of the formula, not bounded if None
+        :param maximum: highest allowed value of the formula, not bounded if None
+        :param point: dictionary of the other axis features with values
+        :return: tuple of lowest and highest value of the feature within bounds, None if there is no such value on
+        the grid
+        """
+
+        import numpy as np
+
+        if feature not in self.features:
+            raise ValueError('No axis for ' + feature)
+        values = self.values[self.features.index(feature)]
+        point = dict({} if point is None else point)
+        point[feature] = values
+        curve = self.lookup(formula, point)
+        within = ~np.isnan(curve)
+        if minimum is not None:
+            within &= curve >= minimum
+        if maximum is not None:
+            within &= curve <= maximum
+        indices = np.flatnonzero(within)
+        if len(indices) == 0:
+            return None
+
+        first = indices[0]
+        last = indices[-1]
+        low = values[first]
+        high = values[last]
+        if first > 0:
+            low = get_crossing(values[first - 1], values[first], curve[first - 1], curve[first], minimum, maximum)
+        if last < len(values) - 1:
+            high = get_crossing(values[last + 1], values[last], curve[last + 1], curve[last], minimum, maximum)
+        return float(low), float(high)
+
+    def save(self, cache_dir):
+        """
+        Saves every surface to a .npy file named by the key of the grid and the formula, see load and
+        atomic_file.open_atomic
+        :param cache_dir: directory the surfaces are saved to
+        """
+
+        import numpy as np
+
+        os.makedirs(cache_dir, exist_ok=True)
+        key = self.get_key()
+        for formula, surface in self.surfaces.items():
+            with open_atomic(os.path.join(cache_dir, key + '.' + formula + '.npy'), 'wb') as out:
+                np.save(out, surface)
+
+    def load(self, cache_dir, formulae=None):
+        """
+        Replaces the surfaces by the surfaces of a grid with the same axes and fixed values saved before. The files
+        are memory mapped, so only the cells looked up are read
+        :param cache_dir: directory the surfaces were saved to
+        :param formulae: keys of the formulae to be loaded; all formulae of get_formulae if None
+        :return: True if all surfaces were found, False if the surfaces were not changed
+        """
+
+        import numpy as np
+
+        key = self.get_key()
+        surface_files = {}
+        for formula in (rf.get_formulae({feature: 0.0 for feature in rf.FORMULA_FEATURES}).keys()
+                        if formulae is None else formulae):
+            surface_files[formula] = os.path.join(cache_dir, key + '.' + formula + '.npy')
+            if not os.path.exists(surface_files[formula]):
+                return False
+        self.surfaces = {formula: np.load(surface_file, mmap_mode='r')
+                         for formula, surface_file in surface_files.items()}
+        return True
+
+
+def get_crossing(x_outside, x_inside, y_outside, y_inside, minimum=None, maximum=None):
+    """
+    Interpolates where a formula crosses the bound it violates between two grid points
+    :param x_outside: feature value of the grid point outside the bounds
+    :param x_inside: feature value of the grid point within the bounds
+    :param y_outside: value of the formula outside the bounds
+    :param y_inside: value of the formula within the bounds
+    :param minimum: lowest allowed value of the formula
+    :param maximum: highest allowed value of the formula
+    :return: feature value at the crossing
+    """
+
+    bound = minimum if minimum is not None and y_outside < minimum else maximum
+    return x_outside + (bound - y_outside) / (y_inside - y_outside) * (x_inside - x_outside)
+
+
+def get_formulae_key():
+    """
+    Returns a key identifying the current formulae by their names and values at PROBE_FEATURES, so that surfaces
+    saved before a formula was changed are not loaded
+    :return: hexadecimal hash
+    """
+
+    key = hashlib.sha1()
+    for formula, value in sorted(rf.get_formulae(PROBE_FEATURES).items()):
+        key.update((formula + '=' + repr(float(value)) + ';').encode('utf-8'))
+    return key.hexdigest()
+
+
+def get_formula_grid(axes, fixed=None, formulae=None, cache_dir=None):
+    """
+    Returns the formulae evaluated on a grid, loaded from the cache directory if it was evaluated before
+    :param axes: list of tuples of feature and strictly increasing values of the feature
+    :param fixed: dictionary of the values of features without an axis
+    :param formulae: keys of the formulae, see readability_formulae.get_formulae; all if None
+    :param cache_dir: directory of the .npy files of the surfaces, not cached if None
+    :return: FormulaGrid
+    """
+
+    if cache_dir is None:
+        return FormulaGrid(axes, fixed, formulae)
+
+    # the surfaces are only evaluated if they are not in the cache
+    grid = FormulaGrid(axes, fixed, formulae, surfaces={})
+    if not grid.load(cache_dir, formulae):
+        grid = FormulaGrid(axes, fixed, formulae)
+        grid.save(cache_dir)
+    return grid
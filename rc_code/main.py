@@ -1,77 +1,612 @@
 __author__ = 'zweiss'
 
+import io
 import os
+import shutil
 import sys
+import tempfile
+from collections import Counter
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
 
 import counts as cnt
 import features as feat
 import readability_formulae as rf
-from nlp import get_tokenized_sentences
+import nlp
+from count_writer import CountWriter
+from count_writer import merge_dumps
+from count_writer import set_count_writer
+from corpus_reader import DEFAULT_DELIMITER
+from corpus_reader import CorpusReader
+from result_cache import ResultCache
+from result_writer import get_result_writer
+from stage_profiler import ProfiledSyllableCache
+from stage_profiler import StageProfiler
+from stage_profiler import get_profiler
+from stage_profiler import set_profiler
+from word_index import build_word_index
+from word_index import load_word_index
+from word_index import set_word_index
+from work_queue import DirectoryCrawler
+from work_queue import Prefetcher
+from work_queue import imap_bounded
+from work_queue import iter_files
+from work_queue import run_jobs
 
+# number of files sent to a pool worker at once
+TASK_SIZE = 32
 
-def analyse_all_files(cur_dir, output_file, save_counts=False):
+# maximal number of files of a task, including files served from the result cache
+MAX_TASK_FILES = 1024
+
+
+def analyse_all_files(cur_dir, output_file, save_counts=False, workers=1, syllable_cache_file=None,
+                      syllable_cache_size=100000, result_cache_file=None, counts_dump_file=None,
+                      background_writer=False, output_format=None, corpus_delimiter=DEFAULT_DELIMITER,
+                      profile_file=None, profile_document=None, count_batch_size=1, rollup_file=None,
+                      tokenizer='nltk', sentence_model_cache=None, queue_size=10000, word_index_file=None,
+                      prefetch_depth=0):
     """
-    Recursively calculates readability formulae for all txt files in a given directory and all subdirectories
-    :param cur_dir: directory to be analysed
+    Recursively calculates readability formulae for all txt files in a given directory and all subdirectories. If a
+    file is given instead of a directory, it is read as corpus of documents separated by delimiter lines, see
+    corpus_reader.CorpusReader
+    :param cur_dir: directory or corpus file to be analysed
     :param output_file: file where results should be saved to
     :param save_counts: saves lists of what was counted if set to true
+    :param workers: number of processes analysing files in parallel, 1 analyses all files in this process
+    :param syllable_cache_file: file the syllable cache is loaded from before and saved to after the analysis
+    :param syllable_cache_size: maximal number of tokens in the syllable cache
+    :param result_cache_file: database of the results of previous runs, only new or changed files are analysed if
+    set; not used if save_counts is set, as the lists of what was counted are only written for analysed files
+    :param counts_dump_file: if set, the lists of what was counted are saved to this single file instead of one file
+    per list and document, see count_writer.CountWriter
+    :param background_writer: saves the lists of what was counted in a background thread if set to true
+    :param output_format: 'csv', 'npz', 'arrow' or 'parquet', see result_writer.get_result_writer; chosen by the
+    extension of the output file if None
+    :param corpus_delimiter: content of the lines separating the documents of a corpus file
+    :param profile_file: if set, the time of every stage of the pipeline is recorded and a json report is saved to
+    this file, see stage_profiler.StageProfiler
+    :param profile_document: document analysed under cProfile and tracemalloc if profile_file is set, its cProfile
+    statistics are saved next to the report with the extension .prof
+    :param count_batch_size: number of files counted at once, see counts.get_counts_batch; 1 counts file by file.
+    Not used if save_counts is set, as batches do not visit single units
+    :param rollup_file: if set, the counts of all documents are summed up per directory and subdirectory and the
+    formulae and features of the sums are saved to this file, see get_rollups; in the format of output_format
+    :param tokenizer: word tokenizer backend, 'nltk' or 'regex', see nlp.ReadabilityAnalyzer
+    :param sentence_model_cache: json file caching the parameters of the sentence model, see
+    nlp.load_sentence_tokenizer
+    :param queue_size: maximal number of files found by the crawler but not yet analysed, see
+    work_queue.DirectoryCrawler
+    :param word_index_file: prefix of a word index built by index_all_files, used by the batch counter to look up
+    the syllables and characters of words, see count_batch_size and word_index.WordIndex. Only used if the files of
+    a directory are counted in batches; the command line turns batch counting on for it
+    :param prefetch_depth: number of files read ahead by a thread pool of this process while files are analysed, see
+    work_queue.Prefetcher; 0 lets every job read its file. Not used for corpus files
     """
 
-    # get a listing of all plain txt files in the dir and all sub dirs
-    txt_file_list = []
-    for root, dirs, files in os.walk(cur_dir):
-        for name in files:
-            if name.endswith('.txt'):
-                txt_file_list.append(os.path.join(root, name))
+    # set up the sentence and word tokenizers; the model cache is written here, before any worker reads it
+    init_analyzer(tokenizer, sentence_model_cache)
 
-    # process all files and save them to the output file
-    counter = 0
-    out = open(output_file, 'w')
-    keys = []
-    for txt_file in txt_file_list:
-        print('Started analysis of ' + txt_file)
+    # set up the syllable cache, warm if a cache file of a previous run exists
+    syllable_cache = init_syllable_cache(syllable_cache_size, syllable_cache_file)
+    if word_index_file is not None:
+        set_word_index(load_word_index(word_index_file))
+
+    # set up the profiler of the stages of the pipeline
+    profiler = None
+    capture_file = None
+    if profile_file is not None:
+        if profile_document is not None:
+            capture_file = os.path.splitext(profile_file)[0] + '.prof'
+        profiler = StageProfiler(capture_document=profile_document, capture_file=capture_file)
+        set_profiler(profiler)
+
+    # set up the writer of the lists of what was counted
+    count_writer = None
+    if save_counts:
+        count_writer = init_count_writer(counts_dump_file, background_writer)
+
+    # txt files in the dir and all sub dirs are found by a crawler while they are analysed; a corpus file is split
+    # into byte ranges of bounded size instead, each of which is analysed as one job
+    crawler = None
+    corpus_ranges = None
+    if os.path.isfile(cur_dir):
+        with CorpusReader(cur_dir, corpus_delimiter) as corpus:
+            corpus_ranges = corpus.get_byte_ranges(1 if workers == 1 else workers * 4)
+    else:
+        crawler = DirectoryCrawler(cur_dir, queue_size=queue_size)
+
+    # the crawler, the result cache, the prefetcher, the pool and the files of its workers are released even if the
+    # analysis fails
+    result_cache = None
+    prefetcher = None
+    pool = None
+    worker_dir = None
+    try:
+        # files unchanged since the last run are looked up instead of analysed, if the results were calculated with
+        # the same counts and tokenizer
+        if result_cache_file is not None and not save_counts and crawler is not None:
+            result_cache = ResultCache(result_cache_file, configuration={'counts': cnt.get_engine().schema,
+                                                                         'tokenizer': tokenizer})
 
-        # analyse data
-        cur_formula_dict = analyse_file(txt_file, save_counts)
-
-        # make header if necessary
-        if len(keys) == 0:
-            out.write('file')
-            keys = sorted(cur_formula_dict.keys())
-            for key in keys:
-                out.write(',' + key)
-            out.write('\n')
-
-        # save data
-        out.write(txt_file)
-        for key in keys:
-            out.write(',' + str(cur_formula_dict[key]))
-        out.write('\n')
-
-        print('Ended analysis of ' + txt_file)
-        counter += 1
-    out.close()
+        # analyse files either one after another or distributed over a process pool; jobs are sent to the pool in
+        # tasks of a few jobs and only a few tasks per worker are in flight, so neither the crawl nor the results run
+        # ahead of the output file. In both cases the results come back in the order the files were found, so the rows
+        # of the output file are deterministic
+        cached_files = None
+        if crawler is None:
+            # without a pool, the documents of a range are analysed while their results are written
+            job_function = analyse_corpus_range_job if workers > 1 else iter_corpus_range_results
+            tasks = ((job_function, [(cur_dir, corpus_delimiter, start, end, save_counts)])
+                     for start, end in corpus_ranges)
+        else:
+            job_function = analyse_file_job
+            task_size = 1 if workers == 1 else TASK_SIZE
+            if count_batch_size > 1 and not save_counts:
+                job_function = analyse_file_batch_job
+                task_size = count_batch_size
+            if result_cache is not None:
+                cached_files = deque()
+            if prefetch_depth > 0:
+                prefetcher = Prefetcher(prefetch_depth)
+            tasks = iter_file_tasks(crawler, job_function, task_size, save_counts, result_cache, cached_files,
+                                    prefetcher)
+        if workers > 1:
+            worker_dir = tempfile.mkdtemp()
+            pool = Pool(workers, initializer=init_worker,
+                        initargs=(syllable_cache_size, syllable_cache_file, worker_dir, save_counts and
+                                  counts_dump_file is not None, background_writer, profiler is not None,
+                                  profile_document, capture_file, tokenizer, sentence_model_cache, word_index_file))
+        results = iter_task_results(imap_bounded(run_jobs, tasks, pool, workers * 4), job_function, result_cache,
+                                    cached_files)
+
+        # process all files and save them to the output file
+        counter = 0
+        rollups = {}
+        out = get_result_writer(output_file, output_format)
+        for txt_file, cur_formula_dict in results:
+            if rollup_file is not None:
+                add_to_rollups(rollups, cur_dir, txt_file if corpus_ranges is None else cur_dir, cur_formula_dict)
+            if profiler is None:
+                out.write(txt_file, cur_formula_dict)
+            else:
+                profiler.call('write', out.write, txt_file, cur_formula_dict)
+            print('Ended analysis of ' + txt_file)
+            counter += 1
+        out.close()
+        pruned = 0
+        if result_cache is not None:
+            # all files have been looked up, the results of the others belong to deleted files
+            pruned = result_cache.prune()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+            # collect the tokens and statistics of the worker caches, the worker profiles and the dumps of the worker
+            # count writers
+            worker_files = sorted(os.listdir(worker_dir))
+            for worker_file in worker_files:
+                if worker_file.endswith('.json'):
+                    syllable_cache.load(os.path.join(worker_dir, worker_file), with_statistics=True)
+                elif worker_file.endswith('.profile') and profiler is not None:
+                    profiler.load(os.path.join(worker_dir, worker_file))
+            if save_counts and counts_dump_file is not None:
+                merge_dumps([os.path.join(worker_dir, worker_file) for worker_file in worker_files
+                             if worker_file.endswith('.dump.tsv')], counts_dump_file)
+    finally:
+        if crawler is not None:
+            crawler.close()
+        if prefetcher is not None:
+            prefetcher.close()
+        if pool is not None:
+            pool.terminate()
+        if worker_dir is not None:
+            shutil.rmtree(worker_dir, ignore_errors=True)
+        if result_cache is not None:
+            result_cache.close()
+
+    if count_writer is not None:
+        count_writer.close()
+
+    if rollup_file is not None:
+        out = get_result_writer(rollup_file, output_format)
+        for directory, rollup in get_rollups(rollups):
+            out.write(directory, rollup)
+        out.close()
+        print('Rollups of ' + str(len(rollups)) + ' directory(s) written to ' + rollup_file)
+
+    if syllable_cache_file is not None:
+        syllable_cache.save(syllable_cache_file)
     print(str(counter) + ' file(s) processed.')
     print('Results written to ' + output_file)
+    if result_cache is not None:
+        stats = result_cache.get_statistics()
+        print('Result cache: ' + str(stats['hits']) + ' file(s) unchanged, ' + str(stats['misses']) +
+              ' file(s) analysed, hit rate ' + str(round(100 * stats['hit_rate'], 2)) + '%, ' + str(pruned) +
+              ' result(s) of deleted files removed')
+    if prefetcher is not None:
+        stats = prefetcher.get_statistics()
+        print('Prefetch: depth ' + str(stats['depth']) + ', ' + str(stats['files']) + ' file(s) read in ' +
+              str(round(stats['read_seconds'], 4)) + ' s, ' + str(round(100 * stats['ready_rate'], 2)) +
+              '% ready when needed, waited ' + str(round(stats['wait_seconds'], 4)) + ' s')
+    stats = syllable_cache.get_statistics()
+    print('Syllable cache: ' + str(stats['hits']) + ' hit(s), ' + str(stats['misses']) + ' miss(es), ' +
+          str(stats['evictions']) + ' eviction(s), hit rate ' + str(round(100 * stats['hit_rate'], 2)) + '%')
+    if profiler is not None:
+        set_profiler(None)
+        profiler.save(profile_file)
+        for stage, stats in profiler.get_report()['stages'].items():
+            print('Stage ' + stage + ': ' + str(round(stats['wall_seconds'], 4)) + ' s wall, ' +
+                  str(round(stats['cpu_seconds'], 4)) + ' s CPU, ' + str(stats['calls']) + ' call(s)')
+        print('Profile written to ' + profile_file)
+
+
+def index_all_files(cur_dir, index_prefix, min_count=1, corpus_delimiter=DEFAULT_DELIMITER, tokenizer='nltk'):
+    """
+    Builds a word index of all txt files in a given directory and all subdirectories, or of all documents of a corpus
+    file, and saves it, see word_index.WordIndex
+    :param cur_dir: directory or corpus file to be indexed
+    :param index_prefix: path the names of the index files start with
+    :param min_count: minimal frequency of words in the index
+    :param corpus_delimiter: content of the lines separating the documents of a corpus file
+    :param tokenizer: word tokenizer backend, 'nltk' or 'regex', see nlp.ReadabilityAnalyzer
+    :return: WordIndex
+    """
+
+    init_analyzer(tokenizer)
+    token_counts = Counter()
+    if os.path.isfile(cur_dir):
+        with CorpusReader(cur_dir, corpus_delimiter) as corpus:
+            for name, start, end in corpus.iter_documents():
+                for sentence in nlp.iter_tokenized_sentences(corpus.iter_chunks(start, end)):
+                    token_counts.update(sentence)
+    else:
+        for txt_file in iter_files(cur_dir):
+            with open(txt_file, 'r') as content_file:
+                for sentence in nlp.iter_tokenized_sentences(nlp.iter_chunks(content_file)):
+                    token_counts.update(sentence)
+
+    # only words are looked up by the counter
+    punctuation = nlp.get_punctuation_set()
+    word_index = build_word_index({token: count for token, count in token_counts.items() if token not in punctuation},
+                                  min_count)
+    word_index.save(index_prefix)
+    return word_index
+
+
+def add_to_rollups(rollups, cur_dir, txt_file, result):
+    """
+    Adds the counts of a document to the sums of its directory and all directories above it up to the analysed
+    directory
+    :param rollups: dictionary of directories with tuples of number of documents and dictionary of summed counts
+    :param cur_dir: analysed directory, or the corpus file, which is rolled up as a single unit
+    :param txt_file: document, or the corpus file for documents of a corpus file
+    :param result: dictionary containing formulae, features and counts for the document
+    """
+
+    root = os.path.normpath(cur_dir)
+    directories = [root]
+    if txt_file != cur_dir:
+        relative_path = os.path.relpath(os.path.dirname(txt_file), cur_dir)
+        if relative_path != '.':
+            for part in relative_path.split(os.sep):
+                directories.append(os.path.join(directories[-1], part))
+    for directory in directories:
+        num_documents, counts = rollups.get(directory, (0, {}))
+        rollups[directory] = num_documents + 1, cnt.merge_counts([counts, result])
+
+
+def get_rollups(rollups):
+    """
+    Calculates readability formulae for the summed counts of directories. The formulae are ratios, so they are
+    calculated on the sums and not averaged over the documents
+    :param rollups: dictionary of directories with tuples of number of documents and dictionary of summed counts
+    :return: list of tuples of directory and dictionary containing formulae, features, counts and the number of
+    documents, sorted by directory
+    """
+
+    results = []
+    for directory, (num_documents, counts) in sorted(rollups.items()):
+        rval = dict(counts)
+        rval.update(feat.get_features(rval))
+        rval.update(rf.get_formulae(rval))
+        rval['COUNTS_num_documents'] = num_documents
+        results.append((directory, rval))
+    return results
+
+
+def analyse_file_job(job):
+    """
+    Analyses a single file for analyse_all_files, either in this process or in a pool worker
+    :param job: tuple of input file, save_counts flag and text of the file, None if it was not read ahead
+    :return: tuple of input file and dictionary containing formulae, features and counts for the document
+    """
+
+    txt_file, save_counts, text = job
+    print('Started analysis of ' + txt_file)
+    return txt_file, analyse_file(txt_file, save_counts, text)
 
 
-def analyse_file(input_file, save_counts=False):
+def analyse_file_batch_job(job):
+    """
+    Analyses a batch of files for analyse_all_files, either in this process or in a pool worker. The tokenized files
+    are counted at once, see counts.get_counts_batch
+    :param job: list of tuples of input file and text of the file, None if it was not read ahead
+    :return: list of tuples of input file and dictionary containing formulae, features and counts for the document
+    """
+
+    # the profiler times documents one by one
+    if get_profiler() is not None:
+        return [analyse_file_job((txt_file, False, text)) for txt_file, text in job]
+
+    tokenized_documents = []
+    for txt_file, text in job:
+        print('Started analysis of ' + txt_file)
+        if text is None:
+            with open(txt_file, 'r') as content_file:
+                tokenized_documents.append(list(nlp.iter_tokenized_sentences(nlp.iter_chunks(content_file))))
+        else:
+            tokenized_documents.append(list(nlp.iter_tokenized_sentences(nlp.iter_chunks(io.StringIO(text)))))
+
+    results = []
+    for (txt_file, text), rval in zip(job, cnt.get_counts_batch(tokenized_documents)):
+        rval.update(feat.get_features(rval))
+        rval.update(rf.get_formulae(rval))
+        results.append((txt_file, rval))
+    return results
+
+
+def analyse_corpus_range_job(job):
+    """
+    Analyses all documents of a corpus file starting within a byte range for analyse_all_files in a pool worker
+    :param job: tuple of corpus file, delimiter, first byte offset and byte offset after the range and save_counts flag
+    :return: list of tuples of document name and dictionary containing formulae, features and counts for the document
+    """
+
+    return list(iter_corpus_range_results(job))
+
+
+def iter_corpus_range_results(job):
+    """
+    Analyses all documents of a corpus file starting within a byte range one by one for analyse_all_files
+    :param job: tuple of corpus file, delimiter, first byte offset and byte offset after the range and save_counts flag
+    :return: generator of tuples of document name and dictionary containing formulae, features and counts for the
+    document
+    """
+
+    corpus_file, delimiter, start, end, save_counts = job
+    with CorpusReader(corpus_file, delimiter) as corpus:
+        for name, document_start, document_end in corpus.iter_documents(start, end):
+            print('Started analysis of ' + name)
+            yield name, analyse_chunks(corpus.iter_chunks(document_start, document_end), name, save_counts)
+
+
+def iter_file_tasks(txt_files, job_function, task_size, save_counts=False, result_cache=None, cached_files=None,
+                    prefetcher=None):
+    """
+    Groups files into tasks for analyse_all_files as they are found. A task is complete when it holds task_size files
+    to be analysed; files unchanged since the last run are not analysed, but looked up in the result cache. With a
+    prefetcher, the files to be analysed are read ahead and their texts are part of the jobs
+    :param txt_files: iterable of files
+    :param job_function: analyse_file_job, or analyse_file_batch_job to count the files of a task at once
+    :param task_size: number of files to be analysed per task
+    :param save_counts: saves lists of what was counted if set to true
+    :param result_cache: ResultCache, all files are analysed if None
+    :param cached_files: deque the files of every task are appended to as tuples of files, cached flags and
+    fingerprints, see iter_task_results; only used with a result cache
+    :param prefetcher: work_queue.Prefetcher, every job reads its file if None
+    :return: generator of tasks, see work_queue.run_jobs
+    """
+
+    lookups = ((txt_file, False, None) if result_cache is None else (txt_file,) + result_cache.lookup(txt_file)
+               for txt_file in txt_files)
+    if prefetcher is None:
+        lookups = ((lookup, None) for lookup in lookups)
+    else:
+        lookups = prefetcher.iter_prefetched(lookups, lambda lookup: None if lookup[1] else lookup[0])
+
+    files = []
+    cached = []
+    fingerprints = {}
+    jobs = []
+    for (txt_file, is_cached, fingerprint), text in lookups:
+        if result_cache is not None and not is_cached:
+            fingerprints[txt_file] = fingerprint
+        files.append(txt_file)
+        cached.append(is_cached)
+        if not is_cached:
+            jobs.append((txt_file, text))
+        if len(jobs) >= task_size or len(files) >= MAX_TASK_FILES:
+            yield get_task(job_function, jobs, save_counts, files, cached, fingerprints, cached_files)
+            files = []
+            cached = []
+            fingerprints = {}
+            jobs = []
+    if len(files) > 0:
+        yield get_task(job_function, jobs, save_counts, files, cached, fingerprints, cached_files)
+
+
+def get_task(job_function, jobs, save_counts, files, cached, fingerprints, cached_files):
+    """
+    Returns a task of iter_file_tasks
+    :param job_function: analyse_file_job or analyse_file_batch_job
+    :param jobs: tuples of file to be analysed and its text, None if it was not read ahead
+    :param save_counts: saves lists of what was counted if set to true
+    :param files: all files of the task
+    :param cached: list of flags, True if the stored result of the corresponding file is valid
+    :param fingerprints: dictionary of fingerprints of the files to be analysed
+    :param cached_files: deque the files of the task are appended to, not used if None
+    :return: tuple of job function and list of jobs
+    """
+
+    if cached_files is not None:
+        cached_files.append((files, cached, fingerprints))
+    if job_function is analyse_file_batch_job:
+        return job_function, [jobs] if len(jobs) > 0 else []
+    return job_function, [(txt_file, save_counts, text) for txt_file, text in jobs]
+
+
+def iter_task_results(task_results, job_function, result_cache=None, cached_files=None):
+    """
+    Returns the results of the single documents of tasks, merged with the stored results of unchanged files
+    :param task_results: iterable of lists of return values of the job function, one list per task
+    :param job_function: job function of the tasks
+    :param result_cache: ResultCache, not used if None
+    :param cached_files: deque of the files of the tasks as filled by iter_file_tasks, used with the result cache
+    :return: generator of tuples of document name and dictionary containing formulae, features and counts for the
+    document
+    """
+
+    for results in task_results:
+        if job_function is not analyse_file_job:
+            results = (result for job_results in results for result in job_results)
+        if result_cache is not None:
+            files, cached, fingerprints = cached_files.popleft()
+            results = merge_cached_results(files, cached, iter(results), result_cache, fingerprints)
+        for result in results:
+            yield result
+
+
+def merge_cached_results(txt_file_list, cached, results, result_cache, fingerprints):
+    """
+    Merges stored results of unchanged files with the results of analysed files and stores the latter
+    :param txt_file_list: files in the order of the output file
+    :param cached: list of flags, True if the stored result of the corresponding file is valid
+    :param results: iterator of tuples of file and result for all of these files that are not cached, in the same
+    order
+    :param result_cache: ResultCache
+    :param fingerprints: dictionary of fingerprints of the files that are not cached
+    :return: generator of tuples of file and dictionary containing formulae, features and counts for the document
+    """
+
+    for txt_file, is_cached in zip(txt_file_list, cached):
+        if is_cached:
+            yield txt_file, result_cache.load(txt_file)
+        else:
+            txt_file, cur_formula_dict = next(results)
+            result_cache.store(txt_file, fingerprints.pop(txt_file), cur_formula_dict)
+            yield txt_file, cur_formula_dict
+
+
+def init_worker(syllable_cache_size=100000, syllable_cache_file=None, worker_dir=None, dump_counts=False,
+                background_writer=False, profile=False, profile_document=None, capture_file=None, tokenizer='nltk',
+                sentence_model_cache=None, word_index_file=None):
+    """
+    Warms up a pool worker by loading the sentence and word tokenizers and the syllable cache before the first file
+    arrives
+    :param syllable_cache_size: maximal number of tokens in the syllable cache
+    :param syllable_cache_file: file the syllable cache is loaded from
+    :param worker_dir: directory the syllable cache and the count dump of the worker are saved to when the worker
+    exits
+    :param dump_counts: saves the lists of what was counted to a dump file in worker_dir if set to true
+    :param background_writer: saves the lists of what was counted in a background thread if set to true
+    :param profile: records the time of every stage if set to true, the report is saved to worker_dir
+    :param profile_document: document analysed under cProfile and tracemalloc if profile is set
+    :param capture_file: file the cProfile statistics of profile_document are saved to
+    :param tokenizer: word tokenizer backend, 'nltk' or 'regex'
+    :param sentence_model_cache: json file caching the parameters of the sentence model
+    :param word_index_file: prefix of the word index, memory mapped by every worker
+    """
+
+    init_analyzer(tokenizer, sentence_model_cache)
+    syllable_cache = init_syllable_cache(syllable_cache_size, syllable_cache_file)
+    if word_index_file is not None:
+        set_word_index(load_word_index(word_index_file))
+    if worker_dir is not None:
+        worker_file = os.path.join(worker_dir, str(os.getpid()))
+        Finalize(syllable_cache, syllable_cache.save, args=(worker_file + '.json',), exitpriority=10)
+        count_writer = init_count_writer(worker_file + '.dump.tsv' if dump_counts else None, background_writer)
+        Finalize(count_writer, count_writer.close, exitpriority=10)
+        if profile:
+            profiler = StageProfiler(capture_document=profile_document, capture_file=capture_file)
+            set_profiler(profiler)
+            Finalize(profiler, profiler.save, args=(worker_file + '.profile',), exitpriority=10)
+
+
+def init_analyzer(tokenizer='nltk', sentence_model_cache=None):
+    """
+    Sets up the sentence and word tokenizers of this process
+    :param tokenizer: word tokenizer backend, 'nltk' or 'regex', see nlp.ReadabilityAnalyzer
+    :param sentence_model_cache: json file caching the parameters of the sentence model
+    :return: ReadabilityAnalyzer
+    """
+
+    if tokenizer == 'nltk' and sentence_model_cache is None:
+        return nlp.get_analyzer()
+    analyzer = nlp.ReadabilityAnalyzer(tokenizer=tokenizer, sentence_model_cache=sentence_model_cache)
+    nlp.set_analyzer(analyzer)
+    return analyzer
+
+
+def init_count_writer(counts_dump_file=None, background_writer=False):
+    """
+    Sets up the writer of the lists of what was counted of this process
+    :param counts_dump_file: dump file of the consolidated layout, the per document layout is used if None
+    :param background_writer: writes in a background thread if set to true
+    :return: CountWriter
+    """
+
+    if counts_dump_file is None:
+        count_writer = CountWriter(background=background_writer)
+    else:
+        count_writer = CountWriter('consolidated', counts_dump_file, background_writer)
+    set_count_writer(count_writer)
+    return count_writer
+
+
+def init_syllable_cache(syllable_cache_size=100000, syllable_cache_file=None):
+    """
+    Sets up the syllable cache of this process
+    :param syllable_cache_size: maximal number of tokens in the syllable cache
+    :param syllable_cache_file: file the syllable cache is loaded from, if it exists
+    :return: SyllableCache
+    """
+
+    syllable_cache = nlp.SyllableCache(syllable_cache_size)
+    if syllable_cache_file is not None:
+        syllable_cache.load(syllable_cache_file)
+    nlp.set_syllable_cache(syllable_cache)
+    return syllable_cache
+
+
+def analyse_file(input_file, save_counts=False, text=None):
     """
     Calculates readability formulae for a single file
     :param input_file: input file
     :param save_counts: saves lists of what was counted if set to true
+    :param text: text of the file if it was read before, e.g. by a work_queue.Prefetcher; the file is read if None
     :return: dictionary containing formulae, features and counts for the document
     """
 
-    # get file content
+    # a text read before is analysed in the same chunks as the file
+    if text is not None:
+        return analyse_chunks(nlp.iter_chunks(io.StringIO(text)), input_file, save_counts)
+
+    # get counts while the file is read, segmentized and tokenized in chunks
     with open(input_file, 'r') as content_file:
-        text = content_file.read()
-    content_file.close()
+        return analyse_chunks(nlp.iter_chunks(content_file), input_file, save_counts)
 
-    # get counts
-    tokenized_sentences = get_tokenized_sentences(text)
+
+def analyse_chunks(chunks, name, save_counts=False):
+    """
+    Calculates readability formulae for a document read in chunks
+    :param chunks: iterable of consecutive pieces of the document
+    :param name: name of the document, the lists of what was counted are saved next to it
+    :param save_counts: saves lists of what was counted if set to true
+    :return: dictionary containing formulae, features and counts for the document
+    """
+
+    profiler = get_profiler()
+    if profiler is not None:
+        if profiler.is_captured(name):
+            return profiler.run_captured(analyse_chunks_profiled, chunks, name, save_counts, profiler)
+        return analyse_chunks_profiled(chunks, name, save_counts, profiler)
+
+    # get counts while the document is segmentized and tokenized chunk by chunk
+    tokenized_sentences = nlp.iter_tokenized_sentences(chunks)
     if save_counts:
-        rval = cnt.get_and_save_counts(tokenized_sentences, input_file)
+        rval = cnt.get_and_save_counts(tokenized_sentences, name)
     else:
         rval = cnt.get_counts(tokenized_sentences)
 
@@ -84,17 +619,154 @@ def analyse_file(input_file, save_counts=False):
     return rval
 
 
+def analyse_chunks_profiled(chunks, name, save_counts, profiler):
+    """
+    Calculates readability formulae for a document read in chunks like analyse_chunks and records the time of every
+    stage of the pipeline
+    :param chunks: iterable of consecutive pieces of the document
+    :param name: name of the document, the lists of what was counted are saved next to it
+    :param save_counts: saves lists of what was counted if set to true
+    :param profiler: StageProfiler
+    :return: dictionary containing formulae, features and counts for the document
+    """
+
+    profiler.start_document(name)
+
+    # each stage is timed separately, the streaming order of reading, segmentizing, tokenizing and counting is kept
+    analyzer = nlp.get_analyzer()
+    sentences = profiler.iter_timed('sentences', analyzer.iter_sentences(profiler.iter_timed('read', chunks)))
+    tokenized_sentences = (profiler.call('tokens', analyzer.get_tokens, sentence) for sentence in sentences)
+
+    # get counts, the syllable lookups of the counting engine are timed by a wrapper of the syllable cache
+    syllable_cache = nlp.get_syllable_cache()
+    nlp.set_syllable_cache(ProfiledSyllableCache(syllable_cache, profiler))
+    try:
+        if save_counts:
+            rval = profiler.call('counts', cnt.get_and_save_counts, tokenized_sentences, name)
+        else:
+            rval = profiler.call('counts', cnt.get_counts, tokenized_sentences)
+    finally:
+        nlp.set_syllable_cache(syllable_cache)
+
+    # get features
+    rval.update(profiler.call('features', feat.get_features, rval))
+
+    # get formulae
+    rval.update(profiler.call('formulae', rf.get_formulae, rval))
+
+    profiler.end_document()
+    return rval
+
+
+def analyse_text(text):
+    """
+    Calculates readability formulae for a text held in memory
+    :param text: text to be analysed
+    :return: dictionary containing formulae, features and counts for the text
+    """
+
+    # get counts
+    rval = cnt.get_counts(nlp.get_tokenized_sentences(text))
+
+    # get features
+    rval.update(feat.get_features(rval))
+
+    # get formulae
+    rval.update(rf.get_formulae(rval))
+
+    return rval
+
+
 if __name__ == '__main__':
 
+    # build a word index instead of analysing files
+    if len(sys.argv) > 1 and sys.argv[1] == 'index':
+        usage = 'Wrong number of arguments, call: python3 main.py index <input directory or corpus file> ' \
+                '<index prefix> (--min-count N) (--delimiter <delimiter line>) (--tokenizer nltk|regex)'
+        if len(sys.argv) < 4:
+            sys.exit(usage)
+        options = {}
+        args = sys.argv[4:]
+        while len(args) > 0:
+            arg = args.pop(0)
+            if arg == '--min-count' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+                options['min_count'] = int(args.pop(0))
+            elif arg == '--delimiter' and len(args) > 0:
+                options['corpus_delimiter'] = args.pop(0)
+            elif arg == '--tokenizer' and len(args) > 0 and args[0] in nlp.TOKENIZERS:
+                options['tokenizer'] = args.pop(0)
+            else:
+                sys.exit(usage)
+        index = index_all_files(sys.argv[2], sys.argv[3], **options)
+        print(str(len(index.vocabulary)) + ' word(s) written to ' + sys.argv[3] + '.*.npy')
+        print('Done.')
+        sys.exit()
+
     # check for correct number of arguments
+    usage = 'Wrong number of arguments, call: python3 main.py <input directory or corpus file> <output file> ' \
+            '(counts) (--workers N) (--syllable-cache <cache file>.json) (--syllable-cache-size N) (--incremental) ' \
+            '(--counts-dump <dump file>.tsv) (--background-writer) (--format csv|npz|arrow|parquet) ' \
+            '(--delimiter <delimiter line>) (--profile <report file>.json) (--profile-document <file>) ' \
+            '(--count-batch N) (--rollups <rollup file>) (--tokenizer nltk|regex) ' \
+            '(--sentence-cache <cache file>.json) (--queue-size N) (--word-index <index prefix>) ' \
+            '(--prefetch N)'
     if len(sys.argv) < 3:
-        sys.exit('Wrong number of arguments, call: python3 main.py <input directory> <output file>.csv (counts)')
+        sys.exit(usage)
 
-    # read files from directory recursively
-    if len(sys.argv) == 4 and sys.argv[3].lower() == "counts":
-        analyse_all_files(sys.argv[1], sys.argv[2], save_counts=True)
-    else:
-        analyse_all_files(sys.argv[1], sys.argv[2])
+    # read optional arguments
+    options = {'save_counts': False, 'workers': 1}
+    args = sys.argv[3:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg.lower() == 'counts':
+            options['save_counts'] = True
+        elif arg == '--workers' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            options['workers'] = int(args.pop(0))
+        elif arg == '--syllable-cache' and len(args) > 0:
+            options['syllable_cache_file'] = args.pop(0)
+        elif arg == '--syllable-cache-size' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            options['syllable_cache_size'] = int(args.pop(0))
+        elif arg == '--incremental':
+            options['result_cache_file'] = sys.argv[2] + '.cache.sqlite'
+        elif arg == '--counts-dump' and len(args) > 0:
+            options['save_counts'] = True
+            options['counts_dump_file'] = args.pop(0)
+        elif arg == '--background-writer':
+            options['background_writer'] = True
+        elif arg == '--format' and len(args) > 0 and args[0] in ('csv', 'npz', 'arrow', 'parquet'):
+            options['output_format'] = args.pop(0)
+        elif arg == '--delimiter' and len(args) > 0:
+            options['corpus_delimiter'] = args.pop(0)
+        elif arg == '--profile' and len(args) > 0:
+            options['profile_file'] = args.pop(0)
+        elif arg == '--profile-document' and len(args) > 0:
+            options['profile_document'] = args.pop(0)
+        elif arg == '--count-batch' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            options['count_batch_size'] = int(args.pop(0))
+        elif arg == '--rollups' and len(args) > 0:
+            options['rollup_file'] = args.pop(0)
+        elif arg == '--tokenizer' and len(args) > 0 and args[0] in nlp.TOKENIZERS:
+            options['tokenizer'] = args.pop(0)
+        elif arg == '--sentence-cache' and len(args) > 0:
+            options['sentence_model_cache'] = args.pop(0)
+        elif arg == '--queue-size' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            options['queue_size'] = int(args.pop(0))
+        elif arg == '--word-index' and len(args) > 0:
+            options['word_index_file'] = args.pop(0)
+        elif arg == '--prefetch' and len(args) > 0 and args[0].isdigit():
+            options['prefetch_depth'] = int(args.pop(0))
+        else:
+            sys.exit(usage)
+
+    # the word index is only looked up by the batch counter, so it turns batch counting on
+    if 'word_index_file' in options:
+        if options['save_counts'] or os.path.isfile(sys.argv[1]):
+            sys.exit('--word-index is only used for counting batches of files of a directory, it cannot be combined '
+                     'with counts, --counts-dump or a corpus file')
+        options.setdefault('count_batch_size', TASK_SIZE)
+
+    # read files from directory recursively, or documents from a corpus file
+    analyse_all_files(sys.argv[1], sys.argv[2], **options)
 
     # finished
     print('Done.')
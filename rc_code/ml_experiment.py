@@ -1,15 +1,7 @@
 __author__ = 'zweiss'
 
 
-import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
 from readability_formulae import *
-from scipy import stats
-from sklearn.dummy import DummyClassifier
-
-from sklearn.linear_model import LogisticRegression
-from sklearn.cross_validation import StratifiedKFold, cross_val_score
 
 
 def plot_felsch_scores(sentence_length, word_length, var_asl=True):
@@ -20,6 +12,8 @@ def plot_felsch_scores(sentence_length, word_length, var_asl=True):
     :param var_asl: True if sentence length is variable and word length is fixed, false otherwise
     """
 
+    import matplotlib.pyplot as plt
+
     if var_asl:
         x = sentence_length
         xlabel = 'Average Sentence Length in Tokens'
@@ -46,6 +40,8 @@ def plot_vienna_scores(long_words_syll, sent_length, long_words_char, short_word
     :param var_long_Syll: true if number of long syllable words is variable, false if sentence length is
     """
 
+    import matplotlib.pyplot as plt
+
     if var_long_syll:
         x = long_words_syll
         xlabel = 'Ratio of Words >= 3 Syllables'
@@ -67,6 +63,16 @@ def plot_vienna_scores(long_words_syll, sent_length, long_words_char, short_word
 
 if __name__ == '__main__':
 
+    # the experiment libraries are only needed when the experiment is run, not when the plot functions are imported
+    import numpy as np
+    import pandas as pd
+    from scipy import stats
+    from sklearn.dummy import DummyClassifier
+
+    from sklearn.linear_model import LogisticRegression
+
+    from evaluation import cross_validate
+
     np.random.seed(1)
 
     # =================================================================================================================
@@ -120,54 +126,31 @@ if __name__ == '__main__':
     classes = data.iloc[:, 6].as_matrix()  # cerf overall score at index 6
     classes
 
-    folds = StratifiedKFold(classes, 10)  # creates an index to be used in cross validation
-
     lr = LogisticRegression(multi_class='multinomial', solver='lbfgs')
 
-    # iterate over features and build models based on single fomula
-    lr_f1 = []
-    lr_precision = []
-    lr_recall = []
-
-    start_formluae = 31  # formulae start at index 31
-    for f in range(start_formluae, len(data.columns)):
-        predictors = data.iloc[:, [f]].values
-        lr_f1.append(cross_val_score(lr, predictors, classes, cv=10, scoring='f1_weighted'))
-        lr_precision.append(cross_val_score(lr, predictors, classes, cv=10, scoring='precision_weighted'))
-        lr_recall.append(cross_val_score(lr, predictors, classes, cv=10, scoring='recall_weighted'))
-        # _micro, _macro, _weighted, _samples
+    # build models based on single formulae; formulae start at index 31
+    start_formluae = 31
+    formula_names = ['ALI', 'FGS', 'FRE', 'MRI', 'ARI', 'CLI', 'Fog', 'Lix', 'WSF1', 'WSF2', 'WSF3', 'WSF4']
+    models = {name: (lr, data.iloc[:, [f]].values)
+              for name, f in zip(formula_names, range(start_formluae, len(data.columns)))}
 
     # feature baseline
-    feat_f1 = cross_val_score(lr, data.iloc[:, 23:start_formluae].values, classes, cv=10, scoring='f1_weighted')
-    feat_precision = cross_val_score(lr, data.iloc[:, 23:start_formluae].values, classes, cv=10, scoring='precision_weighted')
-    feat_recall = cross_val_score(lr, data.iloc[:, 23:start_formluae].values, classes, cv=10, scoring='recall_weighted')
+    models['FEAT'] = (lr, data.iloc[:, 23:start_formluae].values)
 
     # majority baseline
     dummy_classifier = DummyClassifier(strategy="most_frequent", random_state=0)
-    random_f1 = cross_val_score(dummy_classifier, [[0]]*len(classes), classes, cv=10, scoring='f1_weighted')
-    random_precision = cross_val_score(dummy_classifier, [[0]]*len(classes), classes, cv=10, scoring='precision_weighted')
-    random_recall = cross_val_score(dummy_classifier, [[0]]*len(classes), classes, cv=10, scoring='recall_weighted')
-
-    f1_performance = pd.DataFrame({'ALI': lr_f1[0], 'FGS': lr_f1[1], 'FRE': lr_f1[2], 'MRI': lr_f1[3], 'ARI': lr_f1[4],
-                                   'CLI': lr_f1[5], 'Fog': lr_f1[6], 'Lix': lr_f1[7], 'WSF1': lr_f1[8], 'WSF2': lr_f1[9],
-                                   'WSF3': lr_f1[10], 'WSF4': lr_f1[11], 'FEAT': feat_f1, 'BASE': random_f1},
-                                  index=[n for n in range(0, 10)])
+    models['BASE'] = (dummy_classifier, np.zeros((len(classes), 1)))
+
+    # every model is fitted once per fold for all three metrics, the folds of all models in parallel
+    scores = cross_validate(models, classes, 10, cache_dir='ml_experiment_cache')
+
+    f1_performance = pd.DataFrame(scores['f1_weighted'], index=[n for n in range(0, 10)])
     f1_performance.mean()
 
-    precision_performance = pd.DataFrame({'ALI': lr_precision[0], 'FGS': lr_precision[1], 'FRE': lr_precision[2],
-                                          'MRI': lr_precision[3], 'ARI': lr_precision[4], 'CLI': lr_precision[5],
-                                          'Fog': lr_precision[6], 'Lix': lr_precision[7], 'WSF1': lr_precision[8],
-                                          'WSF2': lr_precision[9], 'WSF3': lr_precision[10], 'WSF4': lr_precision[11],
-                                          'FEAT': feat_precision, 'BASE': random_precision},
-                                         index=[n for n in range(0, 10)])
+    precision_performance = pd.DataFrame(scores['precision_weighted'], index=[n for n in range(0, 10)])
     precision_performance.mean()
 
-    recall_performance = pd.DataFrame({'ALI': lr_recall[0], 'FGS': lr_recall[1], 'FRE': lr_recall[2],
-                                       'MRI': lr_recall[3], 'ARI': lr_recall[4], 'CLI': lr_recall[5],
-                                       'Fog': lr_recall[6], 'Lix': lr_recall[7], 'WSF1': lr_recall[8],
-                                       'WSF2': lr_recall[9], 'WSF3': lr_recall[10], 'WSF4': lr_recall[11],
-                                       'FEAT': feat_recall, 'BASE': random_recall},
-                                      index=[n for n in range(0, 10)])
+    recall_performance = pd.DataFrame(scores['recall_weighted'], index=[n for n in range(0, 10)])
     recall_performance.mean()
 
     # ================================================================================================================
@@ -1,7 +1,320 @@
 __author__ = 'zweiss'
 
-import nltk.data
-from nltk.tokenize import WordPunctTokenizer
+import importlib.util
+import json
+import re
+from collections import OrderedDict
+from collections import defaultdict
+from os import path
+
+from atomic_file import open_atomic
+
+# punctuation marks as a set for constant time membership tests, see get_punctuation_list
+PUNCTUATION = frozenset(['.', ':', ',', ';', '!', '?', '"', '\'', '(', ')', '[', ']', '{', '}', '<', '>', '/', '\\',
+                         '-'])
+
+# a vowel or a diphthong, i.e. a vowel followed by a second vowel that is not counted
+SYLLABLE_PATTERN = re.compile('[aeiouyüäö]{1,2}')
+
+# pattern of nltk's WordPunctTokenizer, used directly by the regex tokenizer backend
+WORD_PUNCT_PATTERN = r'\w+|[^\w\s]+'
+
+# word tokenizer backends of ReadabilityAnalyzer
+TOKENIZERS = ('nltk', 'regex')
+
+
+class ReadabilityAnalyzer:
+    """
+    Segmentizes and tokenizes texts. The sentence and word tokenizers are loaded once when the analyzer is created and
+    reused for every text afterwards.
+
+    Two word tokenizer backends produce identical tokens: 'nltk' tokenizes every sentence with nltk's
+    WordPunctTokenizer, 'regex' applies the compiled pattern of WordPunctTokenizer directly to the whole text, limited
+    to the span of each sentence, so sentences are neither copied nor passed through nltk's tokenizer machinery.
+
+    nltk is imported when the first analyzer is created, so that importing this module stays fast
+    """
+
+    def __init__(self, sentence_model='tokenizers/punkt/german.pickle', tokenizer='nltk', sentence_model_cache=None):
+        """
+        Loads the sentence and word tokenizers
+        :param sentence_model: nltk resource of the Punkt sentence model
+        :param tokenizer: word tokenizer backend, either 'nltk' or 'regex'
+        :param sentence_model_cache: json file the parameters of the sentence model are loaded from instead of the
+        model, see load_sentence_tokenizer
+        """
+
+        if tokenizer not in TOKENIZERS:
+            raise ValueError('Unknown tokenizer: ' + str(tokenizer))
+        self.tokenizer = tokenizer
+        self.sentence_tokenizer = load_sentence_tokenizer(sentence_model, sentence_model_cache)
+        self.word_tokenizer = None
+        self.token_pattern = None
+        if tokenizer == 'nltk':
+            from nltk.tokenize import WordPunctTokenizer
+            self.word_tokenizer = WordPunctTokenizer()
+        else:
+            self.token_pattern = get_word_punct_pattern()
+
+    def get_tokenized_sentences(self, text):
+        """
+        Segmentizes and tokenizes a text
+        :param text: text to be segmentized and tokenized
+        :return: list of tokenized sentences
+        """
+
+        if self.token_pattern is not None:
+            findall = self.token_pattern.findall
+            return [findall(text, start, end) for start, end in self.sentence_tokenizer.span_tokenize(text)]
+
+        tokenized_sentences = []
+        for sentence in self.get_sentences(text):
+            tokenized_sentences.append(self.get_tokens(sentence))
+
+        return tokenized_sentences
+
+    def get_sentences(self, text):
+        """
+        Segmentizes a text to sentences
+        :param text: text to be segmentized
+        :return: List of segmentized sentences
+        """
+
+        return self.sentence_tokenizer.tokenize(text)
+
+    def iter_tokenized_sentences(self, chunks):
+        """
+        Segmentizes and tokenizes a text given in chunks, see iter_sentences
+        :param chunks: iterable of consecutive pieces of the text
+        :return: generator of tokenized sentences
+        """
+
+        if self.token_pattern is not None:
+            findall = self.token_pattern.findall
+            for buffer, start, end in self.iter_sentence_spans(chunks):
+                yield findall(buffer, start, end)
+        else:
+            for sentence in self.iter_sentences(chunks):
+                yield self.get_tokens(sentence)
+
+    def iter_sentences(self, chunks):
+        """
+        Segmentizes a text given in chunks without joining the chunks to the whole text, see iter_sentence_spans
+        :param chunks: iterable of consecutive pieces of the text
+        :return: generator of segmentized sentences
+        """
+
+        for buffer, start, end in self.iter_sentence_spans(chunks):
+            yield buffer[start:end]
+
+    def iter_sentence_spans(self, chunks, max_sentence_length=None):
+        """
+        Segmentizes a text given in chunks without joining the chunks to the whole text. Each buffer is segmentized up
+        to its last whitespace and only sentences ending before its last word are returned, the rest is carried over
+        to the next buffer. Sentence boundaries only depend on the following word, so every returned boundary is
+        decided on the same context as for the whole text and the sentences are identical to those of get_sentences.
+
+        Only the carried text from the word before the last word on is segmentized again with the next chunk, the part
+        of an unfinished sentence before it cannot contain a boundary any more and is kept aside. Every character is
+        thus segmentized a bounded number of times, also in long texts without sentence endings such as transcripts. If
+        max_sentence_length is set, sentences longer than it are split before the word exceeding the length, which
+        bounds memory by the chunk size plus the maximal sentence length but adds boundaries Punkt would not find
+        :param chunks: iterable of consecutive pieces of the text
+        :param max_sentence_length: number of characters after which a sentence is split, None never splits sentences
+        :return: generator of tuples of buffer, start and end of a sentence within the buffer
+        """
+
+        # the unfinished sentence is kept in pieces: head, which cannot contain a boundary any more, and carry, which is
+        # segmentized again; pending are the following chunks without whitespace. A sentence may end within a word,
+        # e.g. after the first mark of '!!!', and Punkt decides on the rest of the word only with its beginning, so the
+        # carry then starts with the word and its first skip characters have been returned already
+        head = []
+        head_length = 0
+        carry = ''
+        skip = 0
+        pending = []
+        pending_length = 0
+        for chunk in chunks:
+
+            # a chunk without whitespace continues the last word, nothing new can be segmentized
+            if get_last_whitespace(chunk) < 0:
+                pending.append(chunk)
+                pending_length += len(chunk)
+                if max_sentence_length is not None and \
+                        head_length + len(carry) - skip + pending_length > max_sentence_length:
+                    if head_length > 0:
+                        yield from iter_joined(head)
+                        head = []
+                        head_length = 0
+                    if len(carry) - skip + pending_length > max_sentence_length:
+                        # a single word longer than a sentence may be
+                        yield from iter_joined([carry[skip:]] + pending)
+                        carry = ''
+                        skip = 0
+                        pending = []
+                        pending_length = 0
+                continue
+            buffer = carry + ''.join(pending) + chunk
+            pending = []
+            pending_length = 0
+
+            # do not segmentize the last word, it may continue in the next chunk
+            text = buffer[:get_last_whitespace(buffer)]
+            last_word = get_last_whitespace(text.rstrip()) + 1
+
+            # sentences ending before the last complete word are not affected by the following chunks
+            carry_start = skip
+            for start, end in self.sentence_tokenizer.span_tokenize(text):
+                if end <= skip:
+                    continue
+                start = max(start, skip)
+                carry_start = start
+                if end > last_word:
+                    break
+                if head_length > 0:
+                    # the first sentence starts in the head
+                    sentence = ''.join(head) + buffer[start:end]
+                    head = []
+                    head_length = 0
+                    yield sentence, 0, len(sentence)
+                else:
+                    yield buffer, start, end
+            # the end of a sentence found in the word before the last word is realigned with the last word; Punkt
+            # treats the first word of a text differently if the text starts with whitespace, so leading whitespace is
+            # never split off
+            scan_start = get_last_whitespace(text[:last_word].rstrip()) + 1
+            if carry_start < scan_start and not buffer[carry_start:scan_start].isspace():
+                head.append(buffer[carry_start:scan_start])
+                head_length += scan_start - carry_start
+                carry = buffer[scan_start:]
+                skip = 0
+            else:
+                word_start = carry_start
+                if carry_start > 0 and get_last_whitespace(buffer[carry_start - 1]) < 0:
+                    word_start = get_last_whitespace(buffer[:carry_start]) + 1
+                carry = buffer[word_start:]
+                skip = carry_start - word_start
+            if max_sentence_length is not None and head_length + len(carry) - skip > max_sentence_length:
+                yield from iter_joined(head)
+                head = []
+                head_length = 0
+
+        buffer = carry + ''.join(pending)
+        for start, end in self.sentence_tokenizer.span_tokenize(buffer):
+            if end <= skip:
+                continue
+            start = max(start, skip)
+            if head_length > 0:
+                sentence = ''.join(head) + buffer[start:end]
+                head = []
+                head_length = 0
+                yield sentence, 0, len(sentence)
+            else:
+                yield buffer, start, end
+        yield from iter_joined(head)
+
+    def get_tokens(self, sentence):
+        """
+        Tokenizes a sentence
+        :param sentence: sentence to be tokenized
+        :return: list of tokens
+        """
+
+        if self.token_pattern is not None:
+            return self.token_pattern.findall(sentence)
+        return self.word_tokenizer.tokenize(sentence)
+
+
+def load_sentence_tokenizer(sentence_model='tokenizers/punkt/german.pickle', sentence_model_cache=None):
+    """
+    Loads a Punkt sentence tokenizer. If a cache file is given, the parameters of the model, i.e. its abbreviations,
+    collocations, sentence starters and orthographic contexts, are read from this json file, which is faster than
+    loading the model with nltk (nltk 3.9 and later parse the model from tab separated files instead of unpickling
+    it); the cache file is written when the model is loaded for the first time, and when it holds another model or
+    cannot be read. Only models using nltk's default Punkt language variables, like the models of nltk, are cached
+    :param sentence_model: nltk resource of the Punkt sentence model
+    :param sentence_model_cache: json file caching the parameters of the model, None loads the model
+    :return: PunktSentenceTokenizer
+    """
+
+    from nltk.tokenize.punkt import PunktLanguageVars
+    from nltk.tokenize.punkt import PunktParameters
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+    if sentence_model_cache is not None and path.exists(sentence_model_cache):
+        # a cache of another model, a corrupt cache and any other file are replaced
+        try:
+            with open(sentence_model_cache, 'r') as content_file:
+                content = json.load(content_file)
+            if isinstance(content, dict) and content.get('model') == sentence_model:
+                params = PunktParameters()
+                params.abbrev_types = set(content['abbrev_types'])
+                params.collocations = set((first, second) for first, second in content['collocations'])
+                params.sent_starters = set(content['sent_starters'])
+                params.ortho_context = defaultdict(int, {token: int(context) for token, context
+                                                         in content['ortho_context'].items()})
+                return PunktSentenceTokenizer(params)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    import nltk.data
+    sentence_tokenizer = nltk.data.load(sentence_model)
+    if sentence_model_cache is not None and isinstance(sentence_tokenizer, PunktSentenceTokenizer) and \
+            type(sentence_tokenizer._lang_vars) is PunktLanguageVars:
+        params = sentence_tokenizer._params
+        content = {'model': sentence_model,
+                   'abbrev_types': sorted(params.abbrev_types),
+                   'collocations': sorted(params.collocations),
+                   'sent_starters': sorted(params.sent_starters),
+                   'ortho_context': dict(sorted(params.ortho_context.items()))}
+        with open_atomic(sentence_model_cache) as out:
+            json.dump(content, out, ensure_ascii=False)
+    return sentence_tokenizer
+
+
+def get_word_punct_pattern():
+    """
+    Compiles the pattern of WordPunctTokenizer with the regular expression engine of the installed nltk version. nltk
+    compiles it with the regex module since it guards patterns with nltk.redos and with the re module before; the two
+    engines differ in which characters are word characters, e.g. combining marks and superscript digits
+    :return: compiled pattern
+    """
+
+    try:
+        import regex
+        # only whether nltk.redos exists matters, the module itself is not used
+        uses_regex = importlib.util.find_spec('nltk.redos') is not None
+    except ImportError:
+        uses_regex = False
+    if not uses_regex:
+        return re.compile(WORD_PUNCT_PATTERN, re.UNICODE | re.MULTILINE | re.DOTALL)
+    return regex.compile(WORD_PUNCT_PATTERN, regex.UNICODE | regex.MULTILINE | regex.DOTALL)
+
+
+# analyzer shared by all calls within this process, see get_analyzer
+shared_analyzer = None
+
+
+def get_analyzer():
+    """
+    Returns the analyzer of this process, it is created on the first call
+    :return: ReadabilityAnalyzer
+    """
+
+    global shared_analyzer
+    if shared_analyzer is None:
+        shared_analyzer = ReadabilityAnalyzer()
+    return shared_analyzer
+
+
+def set_analyzer(analyzer):
+    """
+    Replaces the analyzer of this process, e.g. by one with another tokenizer backend
+    :param analyzer: ReadabilityAnalyzer used by all following calls of get_analyzer
+    """
+
+    global shared_analyzer
+    shared_analyzer = analyzer
 
 
 def get_tokenized_sentences(text):
@@ -11,13 +324,7 @@ def get_tokenized_sentences(text):
     :return: list of tokenized sentences
     """
 
-    tokenized_sentences = []
-    sentences = get_sentences(text)
-    for sentence in sentences:
-        tokenized_sentences.append(get_tokens(sentence))
-
-    return tokenized_sentences
-
+    return get_analyzer().get_tokenized_sentences(text)
 
 
 def get_sentences(text):
@@ -27,55 +334,200 @@ def get_sentences(text):
     :return: List of segmentized sentences
     """
 
-    tokenizer = nltk.data.load('tokenizers/punkt/german.pickle')
-    return tokenizer.tokenize(text)
+    return get_analyzer().get_sentences(text)
+
+
+def iter_tokenized_sentences(chunks):
+    """
+    Segmentizes and tokenizes a text given in chunks
+    :param chunks: iterable of consecutive pieces of the text
+    :return: generator of tokenized sentences
+    """
+
+    return get_analyzer().iter_tokenized_sentences(chunks)
+
+
+def iter_chunks(content_file, chunk_size=65536):
+    """
+    Reads a file in chunks
+    :param content_file: file opened for reading
+    :param chunk_size: number of characters per chunk
+    :return: generator of chunks
+    """
+
+    while True:
+        chunk = content_file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
 
 
 def get_tokens(sentence):
     """
-    Tokenizes a list of sentences
-    :param sentence: list of sentences
-    :return: list of tokenized sentences
+    Tokenizes a sentence
+    :param sentence: sentence to be tokenized
+    :return: list of tokens
+    """
+
+    return get_analyzer().get_tokens(sentence)
+
+
+def get_last_whitespace(text):
+    """
+    Returns the position of the last whitespace in a text
+    :param text: text to be searched
+    :return: index of the last space, tab or line break, -1 if there is none
     """
 
-    tokenizer = WordPunctTokenizer()
-    return tokenizer.tokenize(sentence)
+    return max(text.rfind(' '), text.rfind('\n'), text.rfind('\t'), text.rfind('\r'))
+
+
+def iter_joined(pieces):
+    """
+    Joins the pieces of a sentence that is split off a streamed text, see ReadabilityAnalyzer.iter_sentence_spans
+    :param pieces: list of consecutive pieces of the text
+    :return: generator of a tuple of the joined text, start and end of the sentence without trailing whitespace, none
+    if the pieces are empty or whitespace
+    """
+
+    text = ''.join(pieces)
+    end = len(text.rstrip())
+    if end > 0:
+        yield text, 0, end
 
 
 def get_num_syllables(unit):
     """
-    Returns the number of syllables in a given unit
+    Returns the number of syllables in a given unit. Every vowel starts a syllable, unless it directly follows a vowel
+    that started one, i.e. a run of n vowels such as a diphthong or a doubled vowel counts as (n + 1) // 2 syllables
     :param unit: unit to be counted
     :return: number of syllables
     """
 
-    num_syllables = 0
-    vowels = ['a', 'e', 'i', 'o', 'u', 'y', 'ü', 'ä', 'ö']
-    tmp = "#" + unit.lower() + '#'  # '#' for easier iteration
+    return len(SYLLABLE_PATTERN.findall(unit.lower()))
 
-    cur_char = ''
-    next_char = ''
-    skip = False
-    for c in range(0, len(tmp)-1):
 
-        if skip:
-            skip = False
-            continue
+class SyllableCache:
+    """
+    Memoizes the number of syllables of word tokens. Tokens are cached lowercased, as the syllable count does not depend
+    on the case. The cache is bounded, when it is full the entry chosen by the eviction policy is dropped:
+    'lru' drops the least recently used token, 'fifo' the token cached first
+    """
+
+    def __init__(self, max_size=100000, policy='lru'):
+        """
+        Sets up an empty cache
+        :param max_size: maximal number of cached tokens, None for an unbounded cache
+        :param policy: eviction policy, either 'lru' or 'fifo'
+        """
+
+        if policy not in ('lru', 'fifo'):
+            raise ValueError('Unknown eviction policy: ' + str(policy))
+        self.max_size = max_size
+        self.policy = policy
+        self.syllables = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_num_syllables(self, unit):
+        """
+        Returns the number of syllables in a given unit, see get_num_syllables
+        :param unit: unit to be counted
+        :return: number of syllables
+        """
+
+        key = unit.lower()
+        num_syllables = self.syllables.get(key)
+        if num_syllables is not None:
+            self.hits += 1
+            if self.policy == 'lru':
+                self.syllables.move_to_end(key)
+            return num_syllables
+
+        self.misses += 1
+        num_syllables = get_num_syllables(key)
+        self.add(key, num_syllables)
+        return num_syllables
+
+    def add(self, key, num_syllables):
+        """
+        Adds a lowercased token to the cache and evicts entries if the cache is full
+        :param key: lowercased token
+        :param num_syllables: number of syllables of the token
+        """
+
+        self.syllables[key] = num_syllables
+        if self.max_size is not None:
+            while len(self.syllables) > self.max_size:
+                self.syllables.popitem(last=False)
+                self.evictions += 1
+
+    def get_statistics(self):
+        """
+        Returns the hit and miss statistics of the cache
+        :return: dictionary of hits, misses, evictions, size and hit rate
+        """
+
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.syllables),
+                'hit_rate': 0 if lookups == 0 else self.hits / lookups}
+
+    def save(self, cache_file):
+        """
+        Saves the cached tokens and statistics to a json file, least recently used tokens first. The file is replaced
+        only once it is written completely, see atomic_file.open_atomic
+        :param cache_file: file the cache is written to
+        """
+
+        with open_atomic(cache_file) as out:
+            json.dump({'statistics': self.get_statistics(), 'syllables': self.syllables}, out, ensure_ascii=False)
+
+    def load(self, cache_file, with_statistics=False):
+        """
+        Adds the tokens of a cache file written by save to this cache, missing files are ignored
+        :param cache_file: file the cache was written to
+        :param with_statistics: adds the hits and misses saved in the file to the statistics of this cache
+        """
 
-        cur_char = tmp[c]
-        next_char = tmp[c+1]
+        if not path.exists(cache_file):
+            return
+        with open(cache_file, 'r') as content_file:
+            content = json.load(content_file)
+        evictions = self.evictions
+        for key, num_syllables in content['syllables'].items():
+            self.add(key, num_syllables)
+        self.evictions = evictions
+        if with_statistics:
+            self.hits += content['statistics']['hits']
+            self.misses += content['statistics']['misses']
+            self.evictions += content['statistics']['evictions']
 
-        # increase number of syllables, if current character is a vowel
-        if cur_char in vowels:
-            num_syllables += 1
 
-        # ignore next character, if character bigram is a diphtong, i.e.
-        # the current character is a) the same as the next, b) an e, u, i or y
+# syllable cache shared by all calls within this process, see get_syllable_cache
+shared_syllable_cache = None
 
-        if (cur_char in vowels and next_char in vowels) or cur_char == next_char:
-            skip = True
 
-    return num_syllables
+def get_syllable_cache():
+    """
+    Returns the syllable cache of this process, a default cache is created on the first call
+    :return: SyllableCache
+    """
+
+    global shared_syllable_cache
+    if shared_syllable_cache is None:
+        shared_syllable_cache = SyllableCache()
+    return shared_syllable_cache
+
+
+def set_syllable_cache(syllable_cache):
+    """
+    Replaces the syllable cache of this process
+    :param syllable_cache: SyllableCache used by all following calls of get_syllable_cache
+    """
+
+    global shared_syllable_cache
+    shared_syllable_cache = syllable_cache
 
 
 def get_punctuation_list():
@@ -85,3 +537,12 @@ def get_punctuation_list():
     """
 
     return ['.', ':', ',', ';', '!', '?', '"', '\'', '(', ')', '[', ']', '{', '}', '<', '>', '/', '\\', '-']
+
+
+def get_punctuation_set():
+    """
+    Returns the punctuation marks of get_punctuation_list as a set
+    :return: frozenset of punctuation marks
+    """
+
+    return PUNCTUATION
@@ -1,5 +1,13 @@
 __author__ = 'zweiss'
 
+import features as feat
+
+# features the formulae are calculated on, see get_formulae
+FORMULA_FEATURES = ['FEAT_mean_sentence_length_in_words', 'FEAT_mean_word_length_in_syllables',
+                    'FEAT_mean_word_length_in_characters', 'FEAT_avg_num_1_syllable_words',
+                    'FEAT_avg_num_3_or_more_syllable_words', 'FEAT_avg_num_6_or_more_character_words',
+                    'FEAT_sentence_word_ratio']
+
 
 def get_formulae(features):
     """
@@ -43,6 +51,26 @@ def get_formulae(features):
     }
 
 
+def get_formulae_batch(features):
+    """
+    Calculates readability formulae for many documents at once. All formulae are evaluated as vectorized numpy
+    operations on whole feature columns, which yields the same values as calling get_formulae for every document
+    :param features: columnar features with the FEAT_ columns of features.get_features, e.g. a pandas DataFrame, a
+    numpy structured array or a dictionary of arrays
+    :return: dictionary of numpy arrays with the keys of get_formulae, or a pandas DataFrame sharing the index of
+    features if features is a DataFrame, see features.get_batch_result
+    """
+
+    import numpy as np
+
+    columns = {}
+    for key in FORMULA_FEATURES:
+        columns[key] = np.asarray(features[key], dtype=np.float64)
+    formulae = get_formulae(columns)
+
+    return feat.get_batch_result(formulae, features)
+
+
 # =====================================================================================================================
 # Flesch based formulae
 # =====================================================================================================================
@@ -0,0 +1,151 @@
+__author__ = 'zweiss'
+
+import hashlib
+import json
+import os
+import sqlite3
+
+# version of the calculation of counts, features and formulae; increase it after changing the calculation, so that
+# results stored before are calculated again
+RESULT_VERSION = 1
+
+
+class ResultCache:
+    """
+    Persistent store of analysis results, so that unchanged files do not have to be analysed again. Results are
+    stored in a sqlite database and keyed by file path, size, modification time and content hash. A file whose size and
+    modification time are unchanged is served from the store right away, otherwise its content hash decides.
+
+    Every result is stored with the hash of the configuration it was calculated with, e.g. the count schema and the
+    tokenizer, and RESULT_VERSION; results of another configuration are calculated again. The results of files that
+    no longer exist are deleted by prune
+    """
+
+    def __init__(self, cache_file, commit_interval=1000, configuration=None):
+        """
+        Opens the store, it is created if it does not exist yet
+        :param cache_file: sqlite database file
+        :param commit_interval: number of stored results after which they are committed to the database
+        :param configuration: json serializable description of everything the results depend on besides the files
+        """
+
+        self.configuration = get_configuration_hash(configuration)
+        self.connection = sqlite3.connect(cache_file)
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(results)')]
+        if len(columns) > 0 and 'configuration' not in columns:
+            # stores of earlier versions do not know the configuration of their results
+            self.connection.execute('DROP TABLE results')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (path TEXT PRIMARY KEY, size INTEGER, '
+                                'mtime INTEGER, hash TEXT, configuration TEXT, result TEXT)')
+        # files looked up since the store was opened, see prune
+        self.connection.execute('CREATE TEMP TABLE seen (path TEXT PRIMARY KEY)')
+        self.commit_interval = commit_interval
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, input_file):
+        """
+        Checks whether the stored result of a file is still valid
+        :param input_file: input file
+        :return: tuple of True if the stored result is valid and the fingerprint of the file, see get_fingerprint
+        """
+
+        self.connection.execute('INSERT OR IGNORE INTO seen VALUES (?)', (input_file,))
+        row = self.connection.execute('SELECT size, mtime, hash FROM results WHERE path = ? AND configuration = ?',
+                                      (input_file, self.configuration)).fetchone()
+        stat = os.stat(input_file)
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            self.hits += 1
+            return True, (stat.st_size, stat.st_mtime_ns, row[2])
+
+        fingerprint = (stat.st_size, stat.st_mtime_ns, get_content_hash(input_file))
+        if row is not None and row[0] == stat.st_size and row[2] == fingerprint[2]:
+            # content unchanged, only the modification time is updated
+            self.connection.execute('UPDATE results SET mtime = ? WHERE path = ?', (stat.st_mtime_ns, input_file))
+            self.hits += 1
+            return True, fingerprint
+
+        self.misses += 1
+        return False, fingerprint
+
+    def load(self, input_file):
+        """
+        Returns the stored result of a file
+        :param input_file: input file
+        :return: dictionary containing formulae, features and counts for the document
+        """
+
+        row = self.connection.execute('SELECT result FROM results WHERE path = ?', (input_file,)).fetchone()
+        return json.loads(row[0])
+
+    def store(self, input_file, fingerprint, result):
+        """
+        Stores the result of a file
+        :param input_file: input file
+        :param fingerprint: fingerprint of the file as returned by lookup
+        :param result: dictionary containing formulae, features and counts for the document
+        """
+
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                (input_file, fingerprint[0], fingerprint[1], fingerprint[2], self.configuration,
+                                 json.dumps(result)))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def prune(self):
+        """
+        Deletes the results of all files that were not looked up since the store was opened, e.g. of deleted files.
+        Only to be called after a run over all files
+        :return: number of deleted results
+        """
+
+        return self.connection.execute('DELETE FROM results WHERE path NOT IN (SELECT path FROM seen)').rowcount
+
+    def get_statistics(self):
+        """
+        Returns the hit and miss statistics of the store
+        :return: dictionary of hits, misses and hit rate
+        """
+
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': 0 if lookups == 0 else self.hits / lookups}
+
+    def close(self):
+        """
+        Commits all stored results and closes the store
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+
+def get_content_hash(input_file, chunk_size=1048576):
+    """
+    Returns the sha1 hash of the content of a file
+    :param input_file: input file
+    :param chunk_size: number of bytes read at once
+    :return: hexadecimal hash
+    """
+
+    content_hash = hashlib.sha1()
+    with open(input_file, 'rb') as content_file:
+        while True:
+            chunk = content_file.read(chunk_size)
+            if not chunk:
+                break
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def get_configuration_hash(configuration):
+    """
+    Returns the hash of a configuration together with RESULT_VERSION
+    :param configuration: json serializable description of everything the results depend on besides the files
+    :return: hexadecimal hash
+    """
+
+    content = json.dumps({'version': RESULT_VERSION, 'configuration': configuration}, sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
@@ -0,0 +1,247 @@
+__author__ = 'zweiss'
+
+import zipfile
+from array import array
+
+# output formats and the file extensions they are chosen by
+FORMATS = {'.csv': 'csv', '.npz': 'npz', '.arrow': 'arrow', '.feather': 'arrow', '.parquet': 'parquet'}
+
+
+class CsvResultWriter:
+    """
+    Writes the results of analyse_all_files to a csv file with one row per document
+    """
+
+    def __init__(self, output_file):
+        """
+        Opens the output file
+        :param output_file: csv file the results are written to
+        """
+
+        self.out = open(output_file, 'w')
+        self.keys = None
+
+    def write(self, txt_file, result):
+        """
+        Writes the result of a document
+        :param txt_file: document
+        :param result: dictionary containing formulae, features and counts for the document
+        """
+
+        # make header if necessary
+        if self.keys is None:
+            self.keys = sorted(result.keys())
+            self.out.write('file,' + ','.join(self.keys) + '\n')
+
+        # save data
+        self.out.write(txt_file + ''.join([',' + str(result[key]) for key in self.keys]) + '\n')
+
+    def close(self):
+        """
+        Closes the output file
+        """
+
+        # without documents, only the header of the column 'file' is written
+        if self.keys is None:
+            self.out.write('file\n')
+        self.out.close()
+
+
+class ColumnarResultWriter:
+    """
+    Base of the writers of columnar formats. Results are buffered in typed columns, counts as 64 bit integers and
+    features and formulae as 64 bit floats, and flushed in blocks of rows
+    """
+
+    def __init__(self, output_file, block_size=65536):
+        """
+        Sets up empty columns
+        :param output_file: file the results are written to
+        :param block_size: number of rows buffered before they are flushed
+        """
+
+        self.output_file = output_file
+        self.block_size = block_size
+        self.keys = None
+        self.files = []
+        self.columns = None
+
+    def write(self, txt_file, result):
+        """
+        Buffers the result of a document and flushes the buffered rows if the block is full
+        :param txt_file: document
+        :param result: dictionary containing formulae, features and counts for the document
+        """
+
+        if self.keys is None:
+            self.keys = sorted(result.keys())
+            self.columns = self.get_empty_columns()
+        self.files.append(txt_file)
+        for key in self.keys:
+            self.columns[key].append(result[key])
+        if len(self.files) >= self.block_size:
+            self.flush()
+
+    def get_empty_columns(self):
+        """
+        Returns empty typed columns for all keys
+        :return: dictionary of keys with empty arrays
+        """
+
+        return {key: array('q' if key.startswith('COUNTS_') else 'd') for key in self.keys}
+
+    def flush(self):
+        """
+        Writes the buffered rows, to be implemented by the writers of the formats
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the output file
+        """
+
+        if self.keys is not None and len(self.files) > 0:
+            self.flush()
+
+
+class NpzResultWriter(ColumnarResultWriter):
+    """
+    Writes the results to a compressed numpy .npz file with one array per column and the documents in the array
+    'file'. The npz format cannot be appended to, so all blocks are kept as typed columns until the file is closed
+    """
+
+    def flush(self):
+        """
+        Keeps the buffered rows, the file is only written when closed
+        """
+
+        pass
+
+    def close(self):
+        """
+        Writes all rows to the output file
+        """
+
+        import numpy as np
+
+        columns = [('file', np.array(self.files, dtype=str))]
+        for key in ([] if self.keys is None else self.keys):
+            columns.append((key, np.frombuffer(self.columns[key],
+                                               dtype=np.int64 if key.startswith('COUNTS_') else np.float64)))
+
+        # written like numpy.savez_compressed, which cannot save an array called 'file'
+        with zipfile.ZipFile(self.output_file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for key, column in columns:
+                with archive.open(key + '.npy', 'w', force_zip64=True) as out:
+                    np.lib.format.write_array(out, column, allow_pickle=False)
+
+
+class ArrowResultWriter(ColumnarResultWriter):
+    """
+    Writes the results to an Arrow IPC (Feather version 2) file or, with parquet set to true, a Parquet file, one
+    record batch or row group per block. Needs pyarrow
+    """
+
+    def __init__(self, output_file, block_size=65536, parquet=False):
+        """
+        Sets up empty columns
+        :param output_file: file the results are written to
+        :param block_size: number of rows per record batch or row group
+        :param parquet: writes a Parquet instead of an Arrow file if set to true
+        """
+
+        ColumnarResultWriter.__init__(self, output_file, block_size)
+        self.parquet = parquet
+        self.writer = None
+
+    def flush(self):
+        """
+        Writes the buffered rows as a record batch and starts a new block
+        """
+
+        import pyarrow
+
+        arrays = [pyarrow.array(self.files, pyarrow.string())]
+        for key in self.keys:
+            arrays.append(pyarrow.array(self.columns[key],
+                                        pyarrow.int64() if key.startswith('COUNTS_') else pyarrow.float64()))
+        batch = pyarrow.RecordBatch.from_arrays(arrays, ['file'] + self.keys)
+
+        if self.writer is None:
+            if self.parquet:
+                import pyarrow.parquet
+                self.writer = pyarrow.parquet.ParquetWriter(self.output_file, batch.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.output_file, batch.schema)
+        if self.parquet:
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+        self.files = []
+        self.columns = self.get_empty_columns()
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the output file
+        """
+
+        ColumnarResultWriter.close(self)
+        if self.writer is None:
+            # without documents, a file of only the column 'file' is written
+            self.keys = []
+            self.columns = {}
+            self.flush()
+        self.writer.close()
+
+
+def get_result_writer(output_file, output_format=None):
+    """
+    Returns a writer for the results of analyse_all_files
+    :param output_file: file the results are written to
+    :param output_format: 'csv', 'npz', 'arrow' or 'parquet'; chosen by the file extension if None, csv for unknown
+    extensions
+    :return: result writer
+    """
+
+    if output_format is None:
+        output_format = FORMATS.get(output_file[output_file.rfind('.'):].lower(), 'csv')
+    if output_format == 'csv':
+        return CsvResultWriter(output_file)
+    elif output_format == 'npz':
+        return NpzResultWriter(output_file)
+    elif output_format == 'arrow':
+        return ArrowResultWriter(output_file)
+    elif output_format == 'parquet':
+        return ArrowResultWriter(output_file, parquet=True)
+    raise ValueError('Unknown output format: ' + str(output_format))
+
+
+def load_results(output_file, output_format=None):
+    """
+    Loads the results of analyse_all_files as pandas DataFrame. Arrow files are memory mapped, so that their columns
+    are not copied
+    :param output_file: file the results were written to
+    :param output_format: 'csv', 'npz', 'arrow' or 'parquet'; chosen by the file extension if None
+    :return: DataFrame with the column 'file' and one column per count, feature and formula
+    """
+
+    import pandas as pd
+
+    if output_format is None:
+        output_format = FORMATS.get(output_file[output_file.rfind('.'):].lower(), 'csv')
+    if output_format == 'csv':
+        return pd.read_csv(output_file, float_precision='round_trip')
+    elif output_format == 'npz':
+        import numpy as np
+        with np.load(output_file) as content:
+            return pd.DataFrame({key: content[key] for key in content.files})
+    elif output_format == 'arrow':
+        import pyarrow
+        with pyarrow.memory_map(output_file, 'r') as source:
+            return pyarrow.ipc.open_file(source).read_all().to_pandas()
+    elif output_format == 'parquet':
+        return pd.read_parquet(output_file)
+    raise ValueError('Unknown output format: ' + str(output_format))
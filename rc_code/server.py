@@ -0,0 +1,315 @@
+__author__ = 'zweiss'
+
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import counts as cnt
+import features as feat
+import readability_formulae as rf
+import nlp
+from main import init_worker
+
+
+def analyse_texts(texts):
+    """
+    Calculates readability formulae for a batch of texts, the texts are counted at once, see counts.get_counts_batch
+    :param texts: list of texts
+    :return: list of dictionaries containing formulae, features and counts for each text
+    """
+
+    results = cnt.get_counts_batch([nlp.get_tokenized_sentences(text) for text in texts])
+    for rval in results:
+        rval.update(feat.get_features(rval))
+        rval.update(rf.get_formulae(rval))
+    return results
+
+
+class Batcher:
+    """
+    Collects concurrent scoring requests into batches. A dispatcher thread waits for the first request, adds all
+    requests arriving within the batch wait time up to the batch size and analyses the batch either in this process
+    or as a single task of a process pool, so the models stay loaded and the task overhead is shared by the batch
+    """
+
+    def __init__(self, workers=0, batch_size=32, batch_wait=0.005):
+        """
+        Sets up the batcher and its dispatcher threads
+        :param workers: number of worker processes, 0 analyses all batches in this process
+        :param batch_size: maximal number of texts per batch
+        :param batch_wait: seconds the dispatcher waits for further requests after the first one of a batch
+        """
+
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.requests = queue.Queue()
+        self.executor = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(workers, initializer=init_worker)
+
+        # one dispatcher per worker keeps every worker busy, batches of one dispatcher are analysed one by one
+        self.dispatchers = []
+        for d in range(max(workers, 1)):
+            dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+            dispatcher.start()
+            self.dispatchers.append(dispatcher)
+
+    def submit(self, text):
+        """
+        Queues a text for analysis
+        :param text: text to be analysed
+        :return: Future of the dictionary containing formulae, features and counts for the text
+        """
+
+        if not isinstance(text, str):
+            raise TypeError('texts have to be strings')
+        future = Future()
+        self.requests.put((text, future))
+        return future
+
+    def dispatch(self):
+        """
+        Collects and analyses batches until the batcher is shut down
+        """
+
+        while True:
+            request = self.requests.get()
+            if request is None:
+                # let the other dispatchers see the shutdown as well
+                self.requests.put(None)
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    # let the other dispatchers see the shutdown as well
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+
+            texts = [text for text, future in batch]
+            try:
+                if self.executor is None:
+                    results = analyse_texts(texts)
+                else:
+                    results = self.executor.submit(analyse_texts, texts).result()
+            except Exception as e:
+                for text, future in batch:
+                    future.set_exception(e)
+                continue
+            for (text, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def shutdown(self):
+        """
+        Stops the dispatchers and the worker processes
+        """
+
+        self.requests.put(None)
+        for dispatcher in self.dispatchers:
+            dispatcher.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class LatencyStatistics:
+    """
+    Records the latencies of the latest requests
+    """
+
+    def __init__(self, window=10000):
+        """
+        Sets up empty statistics
+        :param window: number of latest requests the percentiles are calculated on
+        """
+
+        self.latencies = deque(maxlen=window)
+        self.num_requests = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        """
+        Records the latency of a request
+        :param seconds: latency in seconds
+        """
+
+        with self.lock:
+            self.latencies.append(seconds)
+            self.num_requests += 1
+
+    def get_statistics(self):
+        """
+        Returns the number of requests and latency percentiles
+        :return: dictionary of number of requests and p50, p90 and p99 latency in milliseconds
+        """
+
+        with self.lock:
+            latencies = sorted(self.latencies)
+            num_requests = self.num_requests
+        stats = {'requests': num_requests}
+        for percentile in (50, 90, 99):
+            key = 'p' + str(percentile) + '_ms'
+            if len(latencies) == 0:
+                stats[key] = 0
+            else:
+                stats[key] = 1000 * latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)]
+        return stats
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """
+    Handles scoring requests:
+        POST /score with {"text": "..."} returns {"result": {...}},
+        POST /score with {"texts": ["...", ...]} returns {"results": [{...}, ...]},
+        GET /stats returns the latency statistics
+    """
+
+    def do_POST(self):
+        """
+        Scores the texts of a request
+        """
+
+        if self.path != '/score':
+            self.send_json(404, {'error': 'Unknown path: ' + self.path})
+            return
+        start = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            if not isinstance(request, dict):
+                raise TypeError('the request has to be an object')
+            if 'texts' in request:
+                # all texts are checked before any of them is analysed
+                texts = request['texts']
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise TypeError('texts have to be a list of strings')
+                futures = [self.server.batcher.submit(text) for text in texts]
+                response = {'results': [future.result() for future in futures]}
+            else:
+                response = {'result': self.server.batcher.submit(request['text']).result()}
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': 'Invalid request: ' + str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': 'Analysis failed: ' + str(e)})
+            return
+        self.server.latencies.add(time.perf_counter() - start)
+        self.send_json(200, response)
+
+    def do_GET(self):
+        """
+        Returns the latency statistics, and the statistics of the syllable cache if the texts are analysed in the
+        server process; worker processes have caches of their own
+        """
+
+        if self.path == '/stats':
+            stats = self.server.latencies.get_statistics()
+            if self.server.batcher.executor is None:
+                stats['syllable_cache'] = nlp.get_syllable_cache().get_statistics()
+            self.send_json(200, stats)
+        else:
+            self.send_json(404, {'error': 'Unknown path: ' + self.path})
+
+    def send_json(self, status, content):
+        """
+        Sends a json response
+        :param status: http status code
+        :param content: content to be sent as json
+        """
+
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Suppresses the log line of every request
+        """
+
+        pass
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """
+    Threading http server with a configurable backlog of connections waiting to be accepted. The default backlog of
+    socketserver is 5, so bursts of concurrent clients have their connections reset
+    """
+
+    def __init__(self, server_address, handler_class, backlog=128):
+        """
+        Sets up the server and starts listening
+        :param server_address: tuple of host and port
+        :param handler_class: request handler class
+        :param backlog: maximal number of connections waiting to be accepted
+        """
+
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler_class)
+
+
+def make_server(host='127.0.0.1', port=8000, workers=0, batch_size=32, batch_wait=0.005, backlog=128):
+    """
+    Sets up the scoring server with warm models
+    :param host: host the server listens on
+    :param port: port the server listens on
+    :param workers: number of worker processes, 0 analyses all texts in the server process
+    :param batch_size: maximal number of texts per batch
+    :param batch_wait: seconds to wait for further requests of a batch
+    :param backlog: maximal number of connections waiting to be accepted, see ScoringServer
+    :return: ScoringServer
+    """
+
+    nlp.get_analyzer()
+    server = ScoringServer((host, port), ScoringHandler, backlog)
+    server.batcher = Batcher(workers, batch_size, batch_wait)
+    server.latencies = LatencyStatistics()
+    return server
+
+
+if __name__ == '__main__':
+
+    # read optional arguments
+    usage = 'Wrong arguments, call: python3 server.py (--port N) (--workers N) (--batch-size N) (--batch-wait MS) ' \
+            '(--backlog N)'
+    options = {}
+    args = sys.argv[1:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if len(args) == 0 or not args[0].isdigit():
+            sys.exit(usage)
+        if arg == '--port':
+            options['port'] = int(args.pop(0))
+        elif arg == '--workers':
+            options['workers'] = int(args.pop(0))
+        elif arg == '--batch-size' and int(args[0]) > 0:
+            options['batch_size'] = int(args.pop(0))
+        elif arg == '--batch-wait':
+            options['batch_wait'] = int(args.pop(0)) / 1000
+        elif arg == '--backlog' and int(args[0]) > 0:
+            options['backlog'] = int(args.pop(0))
+        else:
+            sys.exit(usage)
+
+    # serve until interrupted
+    scoring_server = make_server(**options)
+    print('Serving on http://' + scoring_server.server_address[0] + ':' + str(scoring_server.server_address[1]))
+    try:
+        scoring_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    scoring_server.batcher.shutdown()
+    scoring_server.server_close()
+    print('Done.')
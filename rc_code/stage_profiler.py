@@ -0,0 +1,273 @@
+__author__ = 'zweiss'
+
+import cProfile
+import heapq
+import json
+import time
+import tracemalloc
+
+# stages of the analysis pipeline in the order of the report
+STAGES = ['read', 'sentences', 'tokens', 'syllables', 'counts', 'features', 'formulae', 'write']
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time and calls per stage of the analysis pipeline, see STAGES, in total and per document.
+    Times are exclusive: a stage called within another stage, e.g. syllables within counts, is subtracted from the
+    outer stage. Only the slowest documents are kept, so that the profiler stays small for large corpora.
+
+    Timing every call adds a small overhead per token, the pipeline does not call the profiler at all unless it is
+    enabled with set_profiler
+    """
+
+    def __init__(self, num_slowest=20, capture_document=None, capture_file=None):
+        """
+        Sets up an empty profiler
+        :param num_slowest: number of slowest documents kept for the report
+        :param capture_document: document analysed under cProfile and tracemalloc, if set
+        :param capture_file: file the cProfile statistics of the captured document are saved to
+        """
+
+        self.num_slowest = num_slowest
+        self.capture_document = capture_document
+        self.capture_file = capture_file
+        self.stages = {}
+        self.num_documents = 0
+        self.slowest = []
+        self.capture = None
+        self.stack = []
+        self.document = None
+        self.document_stages = None
+        self.document_start = None
+
+    def call(self, stage, function, *args):
+        """
+        Calls a function and records its time for a stage
+        :param stage: stage of the pipeline
+        :param function: function to be called
+        :param args: arguments of the function
+        :return: return value of the function
+        """
+
+        # the time of stages called within this call is collected on the stack and subtracted afterwards
+        self.stack.append([0.0, 0.0])
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            return function(*args)
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.thread_time() - start_cpu
+            child_wall, child_cpu = self.stack.pop()
+            self.add(stage, wall - child_wall, cpu - child_cpu)
+            if len(self.stack) > 0:
+                self.stack[-1][0] += wall
+                self.stack[-1][1] += cpu
+
+    def iter_timed(self, stage, iterable):
+        """
+        Records the time of getting every item of an iterable for a stage
+        :param stage: stage of the pipeline
+        :param iterable: iterable, e.g. a generator doing the work of the stage
+        :return: generator of the items of the iterable
+        """
+
+        iterator = iter(iterable)
+        while True:
+            try:
+                item = self.call(stage, next, iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def add(self, stage, wall, cpu, calls=1):
+        """
+        Adds time to a stage, in total and for the current document
+        :param stage: stage of the pipeline
+        :param wall: wall time in seconds
+        :param cpu: CPU time in seconds
+        :param calls: number of calls
+        """
+
+        if stage not in self.stages:
+            self.stages[stage] = {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0}
+        stats = self.stages[stage]
+        stats['calls'] += calls
+        stats['wall_seconds'] += wall
+        stats['cpu_seconds'] += cpu
+        if self.document_stages is not None:
+            self.document_stages[stage] = self.document_stages.get(stage, 0.0) + wall
+
+    def start_document(self, name):
+        """
+        Starts recording the stages of a document
+        :param name: name of the document
+        """
+
+        self.document = name
+        self.document_stages = {}
+        self.document_start = (time.perf_counter(), time.thread_time())
+
+    def end_document(self):
+        """
+        Ends recording the stages of the current document and keeps it if it is among the slowest documents
+        """
+
+        document = {'name': self.document,
+                    'wall_seconds': time.perf_counter() - self.document_start[0],
+                    'cpu_seconds': time.thread_time() - self.document_start[1],
+                    'stages': self.document_stages}
+        self.add_document(document)
+        self.document = None
+        self.document_stages = None
+
+    def add_document(self, document):
+        """
+        Counts a document and keeps it if it is among the slowest documents
+        :param document: dictionary of name, wall and CPU seconds and wall seconds per stage of the document
+        """
+
+        self.num_documents += 1
+        # the heap holds the slowest documents with the fastest of them on top; the number of documents breaks ties
+        entry = (document['wall_seconds'], self.num_documents, document)
+        if len(self.slowest) < self.num_slowest:
+            heapq.heappush(self.slowest, entry)
+        elif entry[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def is_captured(self, name):
+        """
+        Checks whether a document is to be analysed under cProfile and tracemalloc
+        :param name: name of the document
+        :return: True if the document is captured
+        """
+
+        return self.capture_document is not None and name == self.capture_document
+
+    def run_captured(self, function, *args):
+        """
+        Calls a function under cProfile and tracemalloc; the cProfile statistics are saved to the capture file, the
+        peak memory and largest allocations are added to the report
+        :param function: function analysing the captured document
+        :param args: arguments of the function
+        :return: return value of the function
+        """
+
+        profiler = cProfile.Profile()
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            result = profiler.runcall(function, *args)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+        if self.capture_file is not None:
+            profiler.dump_stats(self.capture_file)
+        self.capture = {'document': self.capture_document, 'cprofile_file': self.capture_file,
+                        'peak_memory_bytes': peak,
+                        'top_allocations': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                                            for stat in snapshot.statistics('lineno')[:10]]}
+        return result
+
+    def get_report(self):
+        """
+        Returns the report of all recorded stages and documents
+        :return: dictionary of stages, number of documents, slowest documents and the capture, if any
+        """
+
+        stages = {}
+        for stage in sorted(self.stages.keys(), key=lambda s: (STAGES.index(s) if s in STAGES else len(STAGES), s)):
+            stages[stage] = dict(self.stages[stage])
+        return {'num_documents': self.num_documents,
+                'stages': stages,
+                'slowest_documents': [document for wall, number, document in sorted(self.slowest, reverse=True)],
+                'capture': self.capture}
+
+    def merge(self, report):
+        """
+        Adds the report of another profiler, e.g. of a pool worker
+        :param report: report as returned by get_report
+        """
+
+        for stage, stats in report['stages'].items():
+            self.add(stage, stats['wall_seconds'], stats['cpu_seconds'], stats['calls'])
+        num_documents = self.num_documents + report['num_documents']
+        for document in report['slowest_documents']:
+            self.add_document(document)
+        self.num_documents = num_documents
+        if report['capture'] is not None:
+            self.capture = report['capture']
+
+    def save(self, report_file):
+        """
+        Saves the report as json
+        :param report_file: json file
+        """
+
+        with open(report_file, 'w') as out:
+            json.dump(self.get_report(), out, indent=2)
+
+    def load(self, report_file):
+        """
+        Adds a report saved by another profiler
+        :param report_file: json file
+        """
+
+        with open(report_file, 'r') as content_file:
+            self.merge(json.load(content_file))
+
+
+class ProfiledSyllableCache:
+    """
+    Wraps a syllable cache, so that the syllable lookups of the counting engine are recorded as stage 'syllables'
+    """
+
+    def __init__(self, syllable_cache, profiler):
+        """
+        Wraps a syllable cache
+        :param syllable_cache: nlp.SyllableCache
+        :param profiler: StageProfiler
+        """
+
+        self.syllable_cache = syllable_cache
+        self.profiler = profiler
+
+    def get_num_syllables(self, unit):
+        """
+        Returns the number of syllables of a token and records the time of the lookup
+        :param unit: token
+        :return: number of syllables
+        """
+
+        return self.profiler.call('syllables', self.syllable_cache.get_num_syllables, unit)
+
+    def __getattr__(self, name):
+        return getattr(self.syllable_cache, name)
+
+
+# profiler of this process, None unless profiling is enabled, see get_profiler
+shared_profiler = None
+
+
+def get_profiler():
+    """
+    Returns the profiler of this process
+    :return: StageProfiler, None if profiling is not enabled
+    """
+
+    return shared_profiler
+
+
+def set_profiler(profiler):
+    """
+    Enables or disables profiling for this process
+    :param profiler: StageProfiler used by the pipeline, None disables profiling
+    """
+
+    global shared_profiler
+    shared_profiler = profiler
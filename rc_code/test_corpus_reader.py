@@ -0,0 +1,32 @@
+__author__ = 'zweiss'
+
+import pytest
+
+from corpus_reader import CorpusReader
+
+# corpus of two documents with multibyte characters and windows newlines
+CORPUS = 'Straße über Brücken.\r\nÄrger.\n<DOC>\nZweites Dokument.\n'
+
+
+def test_chunks_equal_text(tmp_path):
+    corpus_file = str(tmp_path / 'corpus.txt')
+    with open(corpus_file, 'w', encoding='utf-8', newline='') as f:
+        f.write(CORPUS)
+    with CorpusReader(corpus_file) as corpus:
+        documents = [corpus.get_text(start, end) for name, start, end in corpus.iter_documents()]
+        for name, start, end in corpus.iter_documents():
+            for chunk_size in range(1, 8):
+                assert ''.join(corpus.iter_chunks(start, end, chunk_size)) == corpus.get_text(start, end)
+    assert documents == ['Straße über Brücken.\nÄrger.\n', 'Zweites Dokument.\n']
+
+
+def test_close_with_suspended_chunks(tmp_path):
+    corpus_file = str(tmp_path / 'corpus.txt')
+    with open(corpus_file, 'w', encoding='utf-8') as f:
+        f.write(CORPUS)
+    # an error while the chunks of a document are read is not masked by closing the map
+    with pytest.raises(ValueError):
+        with CorpusReader(corpus_file) as corpus:
+            chunks = corpus.iter_chunks(0, corpus.size, 4)
+            next(chunks)
+            raise ValueError('error while reading')
@@ -0,0 +1,85 @@
+__author__ = 'zweiss'
+
+import random
+from os import path
+
+import counts as cnt
+
+# count file next to this module, so the tests do not depend on the working directory
+COUNT_FILE = path.join(path.dirname(path.abspath(__file__)), 'counts.txt')
+
+# tokens of random documents, with punctuation, periods and colons and words of 0 to 5 syllables
+TOKENS = ['.', ':', ',', '!', '(', ')', '-', 'x', 'Hund', 'Katze', 'Lesbarkeit', 'Aufmerksamkeit', 'ja', 'Baum',
+          'Sprachverarbeitung', 'schnell', 'Wörter', 'Straße', 'Ei', 'Haus', 'Dokument', 'nltk', '123']
+
+
+class RecordingObserver:
+    """
+    Observer recording every notification of a counting engine
+    """
+
+    def __init__(self):
+        self.units = []
+        self.count_dicts = []
+
+    def start_document(self, name):
+        self.units = []
+
+    def add(self, category, index, num_syllables, unit):
+        self.units.append((category, index, num_syllables, unit))
+
+    def end_document(self, name, count_dict):
+        self.count_dicts.append(count_dict)
+
+
+def get_random_documents(num_documents, seed=0):
+    """
+    Returns random tokenized documents
+    :param num_documents: number of documents
+    :param seed: seed of the random number generator
+    :return: list of documents, each a list of tokenized sentences
+    """
+
+    rng = random.Random(seed)
+    return [[[rng.choice(TOKENS) for t in range(rng.randint(0, 20))] for s in range(rng.randint(0, 30))]
+            for d in range(num_documents)]
+
+
+def test_counting_paths_agree():
+    documents = get_random_documents(30)
+    engine = cnt.CountingEngine(COUNT_FILE)
+    observer = RecordingObserver()
+    notifying_engine = cnt.CountingEngine(COUNT_FILE, [observer])
+    batch = engine.get_counts_batch(documents)
+    for document, batch_counts in zip(documents, batch):
+        counts = engine.get_counts(document)
+        assert notifying_engine.get_counts(document) == counts
+        assert batch_counts == counts
+        assert counts['COUNTS_num_tokens'] == sum(len(sentence) for sentence in document)
+
+
+def test_distinct_tokens_are_flushed():
+    document = [['Wort' + str(i), '.'] for i in range(50)]
+    expected = cnt.CountingEngine(COUNT_FILE).get_counts(document)
+    max_distinct_tokens = cnt.MAX_DISTINCT_TOKENS
+    cnt.MAX_DISTINCT_TOKENS = 7
+    try:
+        assert cnt.CountingEngine(COUNT_FILE).get_counts(document) == expected
+    finally:
+        cnt.MAX_DISTINCT_TOKENS = max_distinct_tokens
+
+
+def test_notified_units_match_counts():
+    observer = RecordingObserver()
+    engine = cnt.CountingEngine(COUNT_FILE, [observer])
+    counts = engine.get_counts([['Die', 'Aufmerksamkeit', ':', 'ja', '.'], ['Ei', ',', 'Lesbarkeit']])
+    categories = [category for category, index, num_syllables, unit in observer.units]
+    assert categories.count('sentences') == counts['COUNTS_num_sentences']
+    assert categories.count('tokens') == counts['COUNTS_num_tokens']
+    assert categories.count('word') == counts['COUNTS_num_tokens_no_punct']
+    assert categories.count('punct_colon') == counts['COUNTS_num_periods_and_colons']
+    assert categories.count('syll3plus') == counts['COUNTS_num_words_3_or_more_syllables']
+    assert categories.count('char6plus') == counts['COUNTS_num_words_6_or_more_characters']
+    # periods and colons are numbered like all punctuation marks
+    assert [index for category, index, s, unit in observer.units if category == 'punct_colon'] == [1, 2]
+    assert ('syll3plus', 1, 4, 'Aufmerksamkeit') in observer.units
@@ -0,0 +1,23 @@
+__author__ = 'zweiss'
+
+import readability_formulae as rf
+from formula_grid import get_formula_grid
+
+# grid of mean sentence length against mean word length in syllables
+AXES = [('FEAT_mean_sentence_length_in_words', [1.0, 10.0, 40.0]),
+        ('FEAT_mean_word_length_in_syllables', [1.0, 2.0, 4.0])]
+
+
+def test_changed_formula_is_not_loaded_from_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    point = {'FEAT_mean_sentence_length_in_words': 10.0, 'FEAT_mean_word_length_in_syllables': 2.0}
+    grid = get_formula_grid(AXES, cache_dir=cache_dir)
+    value = grid.lookup('FLESCH_flesch_reading_ease', point)
+    key = grid.get_key()
+    assert get_formula_grid(AXES, cache_dir=cache_dir).get_key() == key
+
+    flesch_reading_ease = rf.flesch_reading_ease
+    monkeypatch.setattr(rf, 'flesch_reading_ease', lambda *args: flesch_reading_ease(*args) + 1)
+    changed_grid = get_formula_grid(AXES, cache_dir=cache_dir)
+    assert changed_grid.get_key() != key
+    assert changed_grid.lookup('FLESCH_flesch_reading_ease', point) == value + 1
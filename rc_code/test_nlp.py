@@ -0,0 +1,192 @@
+__author__ = 'zweiss'
+
+import importlib.util
+import random
+import re
+import sys
+
+import pytest
+from nltk.tokenize import WordPunctTokenizer
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+from nltk.tokenize.punkt import PunktTrainer
+
+import benchmark
+import nlp
+
+# texts with sentence boundaries within words, at the start of texts and after abbreviations
+BOUNDARY_TEXTS = ['Er kam (b. !!! ) Dann.', 'Er kam (b. !! ) Dann.', '!!! ) Dann.', ' !!! ) Dann. ',
+                  '\n  Er kam. Dann ging er.', 'Er kam z.B. am Mo. um 3 Uhr. Dann?! Ja... Nein.', 'a.! b.! c.!',
+                  '"Hallo." sagte er. (Klammer). Ende.', 'Wort.\n\nWort!\tWort? ', '...', '', ' ', 'Ende']
+
+# words and separators of random texts
+WORDS = ['!!!', '(b.', '!!', '?!?', '..', '.!', 'a.!', ')!', '!)', 'b.', '(x.', '?.', 'Der', 'die', 'Hund', 'z.B.',
+         'Dr.', 'usw.', 'ca.', 'U.S.A.', 'Mann', '"Hallo."', '(Klammer).', 'Ende.', 'Frage?', 'Ruf!', '...', 'Wort.',
+         '.', '!', '?', ')', '"', 'a.b', '1.', 'Jan.', 'x', '--', 'Und', 'Er', '\'s', '.)', '."', '?!']
+SEPARATORS = [' ', ' ', ' ', '  ', '\n', '\n\n', '\t', ' \r\n']
+
+# chunk sizes the texts are streamed in
+CHUNK_SIZES = list(range(1, 13)) + [50, 1000000]
+
+# punctuation marks of the list the set nlp.PUNCTUATION replaced
+PUNCTUATION_LIST = ['.', ':', ',', ';', '!', '?', '"', '\'', '(', ')', '[', ']', '{', '}', '<', '>', '/', '\\', '-']
+
+
+def get_random_text(rng, num_words):
+    """
+    Returns a random text of WORDS and SEPARATORS
+    :param rng: random number generator
+    :param num_words: number of words
+    :return: text
+    """
+
+    return rng.choice(['', ' ', '\n  ']) + ''.join(rng.choice(WORDS) + rng.choice(SEPARATORS)
+                                                   for i in range(num_words)) + rng.choice(['', '.', ' ', 'x'])
+
+
+def get_test_analyzers():
+    """
+    Returns analyzers with an untrained and a trained Punkt model, so no nltk model has to be installed
+    :return: list of ReadabilityAnalyzer
+    """
+
+    trainer = PunktTrainer()
+    trainer.INCLUDE_ALL_COLLOCS = True
+    trainer.train(get_random_text(random.Random(0), 5000), finalize=True)
+    analyzers = []
+    for sentence_tokenizer in (PunktSentenceTokenizer(), PunktSentenceTokenizer(trainer.get_params())):
+        for tokenizer in nlp.TOKENIZERS:
+            analyzer = nlp.ReadabilityAnalyzer.__new__(nlp.ReadabilityAnalyzer)
+            analyzer.tokenizer = tokenizer
+            analyzer.sentence_tokenizer = sentence_tokenizer
+            analyzer.word_tokenizer = None
+            analyzer.token_pattern = None
+            if tokenizer == 'nltk':
+                from nltk.tokenize import WordPunctTokenizer
+                analyzer.word_tokenizer = WordPunctTokenizer()
+            else:
+                analyzer.token_pattern = nlp.get_word_punct_pattern()
+            analyzers.append(analyzer)
+    return analyzers
+
+
+def iter_unicode_texts():
+    """
+    Returns texts of every unicode character placed within, next to and apart from word characters, 256 characters
+    per text
+    :return: generator of texts
+    """
+
+    for block in range(0, 0x110000, 256):
+        # surrogates cannot be encoded and never occur in decoded text
+        yield ''.join(['a' + chr(c) + 'b ' + chr(c) + ' .' + chr(c) + '. ' for c in range(block, block + 256)
+                       if not 0xd800 <= c < 0xe000])
+
+
+def get_chunks(text, chunk_size):
+    """
+    Splits a text into chunks
+    :param text: text to be split
+    :param chunk_size: number of characters per chunk
+    :return: list of chunks
+    """
+
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def test_streamed_sentences_equal_whole_text():
+    rng = random.Random(1)
+    texts = BOUNDARY_TEXTS + [get_random_text(rng, rng.randint(0, 60)) for i in range(40)]
+    for analyzer in get_test_analyzers():
+        for text in texts:
+            sentences = analyzer.get_sentences(text)
+            tokenized_sentences = analyzer.get_tokenized_sentences(text)
+            for chunk_size in CHUNK_SIZES:
+                chunks = get_chunks(text, chunk_size)
+                assert list(analyzer.iter_sentences(chunks)) == sentences, (text, chunk_size)
+                assert list(analyzer.iter_tokenized_sentences(chunks)) == tokenized_sentences, (text, chunk_size)
+
+
+def test_long_sentence_is_not_split():
+    analyzer = get_test_analyzers()[0]
+    text = ' '.join(['Wort'] * 60000) + '.'
+    assert list(analyzer.iter_sentences(get_chunks(text, 4096))) == [text]
+
+
+def test_max_sentence_length_splits_before_word():
+    analyzer = get_test_analyzers()[0]
+    text = ' '.join(['Wort'] * 100)
+    sentences = list(analyzer.iter_sentences(get_chunks(text, 16)))
+    split_sentences = [buffer[start:end] for buffer, start, end in
+                       analyzer.iter_sentence_spans(get_chunks(text, 16), max_sentence_length=100)]
+    assert sentences == [text]
+    assert len(split_sentences) > 1
+    assert ' '.join(split_sentences) == text
+    assert all(len(sentence) <= 100 for sentence in split_sentences)
+
+
+def test_syllables_equal_character_loop():
+    words = benchmark.get_syllable_word_list(num_words=100000)
+    assert benchmark.check_syllable_conformance(words) == 0
+    assert nlp.get_num_syllables('Aufmerksamkeit') == benchmark.get_num_syllables_reference('Aufmerksamkeit') == 4
+
+
+def test_punctuation_equals_list():
+    assert nlp.PUNCTUATION == frozenset(PUNCTUATION_LIST)
+    assert nlp.get_punctuation_set() == frozenset(nlp.get_punctuation_list())
+    assert nlp.get_punctuation_list() == PUNCTUATION_LIST
+
+
+def test_regex_tokenizer_equals_nltk():
+    pytest.importorskip('regex')
+    if importlib.util.find_spec('nltk.redos') is None:
+        pytest.skip('the installed nltk compiles its patterns with re')
+    pattern = nlp.get_word_punct_pattern()
+    word_tokenizer = WordPunctTokenizer()
+    assert type(pattern).__module__ != 're'
+    for text in iter_unicode_texts():
+        assert pattern.findall(text) == word_tokenizer.tokenize(text), text
+
+
+def test_re_tokenizer_equals_nltk_before_redos(monkeypatch):
+    # nltk before nltk.redos compiled the pattern of WordPunctTokenizer with re
+    monkeypatch.setitem(sys.modules, 'nltk.redos', None)
+    pattern = nlp.get_word_punct_pattern()
+    word_tokenizer = WordPunctTokenizer()
+    nltk_pattern = re.compile(word_tokenizer._pattern, word_tokenizer._flags)
+    assert type(pattern) is type(nltk_pattern)
+    for text in iter_unicode_texts():
+        assert pattern.findall(text) == nltk_pattern.findall(text), text
+
+
+def test_failed_syllable_cache_save_keeps_file(tmp_path):
+    cache_file = str(tmp_path / 'syllables.json')
+    cache = nlp.SyllableCache()
+    cache.get_num_syllables('Aufmerksamkeit')
+    cache.save(cache_file)
+    with open(cache_file) as f:
+        content = f.read()
+    cache.syllables['unserializable'] = object()
+    with pytest.raises(TypeError):
+        cache.save(cache_file)
+    with open(cache_file) as f:
+        assert f.read() == content
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['syllables.json']
+
+
+def test_bad_sentence_model_cache_is_replaced(tmp_path, monkeypatch):
+    import nltk.data
+    loaded = []
+    monkeypatch.setattr(nltk.data, 'load', lambda name: loaded.append(name) or PunktSentenceTokenizer())
+    cache_file = str(tmp_path / 'punkt.json')
+    for content in ['{"model": "tokenizers/punkt/german.pickle", "abbrev_types": [', '[1, 2]', 'null',
+                    '{"model": "tokenizers/punkt/german.pickle"}', '{"model": "other"}',
+                    '{"model": "tokenizers/punkt/german.pickle", "abbrev_types": [], "collocations": [1], '
+                    '"sent_starters": [], "ortho_context": {}}']:
+        with open(cache_file, 'w') as f:
+            f.write(content)
+        loaded.clear()
+        assert isinstance(nlp.load_sentence_tokenizer(sentence_model_cache=cache_file), PunktSentenceTokenizer)
+        assert loaded == ['tokenizers/punkt/german.pickle'], content
+        # the cache was replaced by a valid one
+        assert isinstance(nlp.load_sentence_tokenizer(sentence_model_cache=cache_file), PunktSentenceTokenizer)
+        assert len(loaded) == 1, content
@@ -0,0 +1,67 @@
+__author__ = 'zweiss'
+
+import sqlite3
+
+from result_cache import ResultCache
+
+
+def store_all(cache, input_files):
+    """
+    Looks up all files and stores a result for every file that is not cached
+    :param cache: ResultCache
+    :param input_files: list of files
+    :return: list of True for every file that was cached
+    """
+
+    cached = []
+    for input_file in input_files:
+        is_cached, fingerprint = cache.lookup(input_file)
+        if not is_cached:
+            cache.store(input_file, fingerprint, {'file': input_file})
+        cached.append(is_cached)
+    return cached
+
+
+def test_configuration_change_invalidates_results(tmp_path):
+    input_files = [str(tmp_path / (name + '.txt')) for name in ('a', 'b')]
+    for input_file in input_files:
+        with open(input_file, 'w') as f:
+            f.write('Ein Satz.')
+    cache_file = str(tmp_path / 'cache.sqlite')
+    for configuration, expected in [('nltk', False), ('nltk', True), ('regex', False), ('regex', True)]:
+        cache = ResultCache(cache_file, configuration={'tokenizer': configuration})
+        assert store_all(cache, input_files) == [expected, expected]
+        cache.close()
+
+
+def test_prune_deletes_unseen_files(tmp_path):
+    input_files = [str(tmp_path / (name + '.txt')) for name in ('a', 'b')]
+    for input_file in input_files:
+        with open(input_file, 'w') as f:
+            f.write('Ein Satz.')
+    cache_file = str(tmp_path / 'cache.sqlite')
+    cache = ResultCache(cache_file)
+    store_all(cache, input_files)
+    cache.close()
+    cache = ResultCache(cache_file)
+    assert store_all(cache, input_files[:1]) == [True]
+    assert cache.prune() == 1
+    cache.close()
+    cache = ResultCache(cache_file)
+    assert store_all(cache, input_files) == [True, False]
+    cache.close()
+
+
+def test_store_without_configuration_is_replaced(tmp_path):
+    input_file = str(tmp_path / 'a.txt')
+    with open(input_file, 'w') as f:
+        f.write('Ein Satz.')
+    cache_file = str(tmp_path / 'cache.sqlite')
+    connection = sqlite3.connect(cache_file)
+    connection.execute('CREATE TABLE results (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, '
+                       'result TEXT)')
+    connection.commit()
+    connection.close()
+    cache = ResultCache(cache_file)
+    assert store_all(cache, [input_file]) == [False]
+    cache.close()
@@ -0,0 +1,32 @@
+__author__ = 'zweiss'
+
+import pytest
+
+from result_writer import get_result_writer
+from result_writer import load_results
+
+# output formats with the modules they need
+FORMAT_MODULES = [('csv', 'pandas'), ('npz', 'numpy'), ('arrow', 'pyarrow'), ('parquet', 'pyarrow')]
+
+
+@pytest.mark.parametrize('output_format,module', FORMAT_MODULES)
+def test_results_round_trip(tmp_path, output_format, module):
+    pytest.importorskip(module)
+    output_file = str(tmp_path / ('results.' + output_format))
+    out = get_result_writer(output_file)
+    out.write('a.txt', {'COUNTS_num_tokens': 3, 'FEAT_mean_sentence_length_in_words': 1.5})
+    out.write('b.txt', {'COUNTS_num_tokens': 0, 'FEAT_mean_sentence_length_in_words': 0.1})
+    out.close()
+    assert load_results(output_file).to_dict('records') == [
+        {'file': 'a.txt', 'COUNTS_num_tokens': 3, 'FEAT_mean_sentence_length_in_words': 1.5},
+        {'file': 'b.txt', 'COUNTS_num_tokens': 0, 'FEAT_mean_sentence_length_in_words': 0.1}]
+
+
+@pytest.mark.parametrize('output_format,module', FORMAT_MODULES)
+def test_results_without_documents(tmp_path, output_format, module):
+    pytest.importorskip(module)
+    output_file = str(tmp_path / ('results.' + output_format))
+    get_result_writer(output_file).close()
+    results = load_results(output_file)
+    assert list(results.columns) == ['file']
+    assert len(results) == 0
@@ -0,0 +1,40 @@
+__author__ = 'zweiss'
+
+from os import path
+
+import window_profile as wp
+
+# count file next to this module, so the tests do not depend on the working directory
+COUNT_FILE = path.join(path.dirname(path.abspath(__file__)), 'counts.txt')
+
+
+def get_windows(num_sentences, window_size, step):
+    """
+    Returns the windows of a document of equal sentences
+    :param num_sentences: number of sentences of the document
+    :param window_size: number of sentences per window
+    :param step: number of sentences between the starts of consecutive windows
+    :return: list of tuples of index of the first sentence and index after the last sentence
+    """
+
+    profile = wp.WindowProfile([['Ein', 'Satz', '.']] * num_sentences, COUNT_FILE)
+    return [(start, end) for start, end, result in profile.iter_windows(window_size, step)]
+
+
+def test_last_window_ends_with_document():
+    assert get_windows(10, 3, 2) == [(0, 3), (2, 5), (4, 7), (6, 9), (7, 10)]
+    assert get_windows(10, 3, 4) == [(0, 3), (4, 7), (7, 10)]
+    for num_sentences in range(1, 15):
+        for window_size in range(1, 6):
+            for step in range(1, 6):
+                windows = get_windows(num_sentences, window_size, step)
+                assert windows[0][0] == 0
+                assert windows[-1][1] == num_sentences
+                assert len(set(windows)) == len(windows)
+
+
+def test_windows_reaching_the_end_are_unchanged():
+    assert get_windows(10, 3, 1) == [(start, start + 3) for start in range(8)]
+    assert get_windows(10, 4, 3) == [(0, 4), (3, 7), (6, 10)]
+    assert get_windows(2, 5, 3) == [(0, 2)]
+    assert get_windows(0, 5, 3) == []
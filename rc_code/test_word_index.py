@@ -0,0 +1,20 @@
+__author__ = 'zweiss'
+
+import pytest
+
+import nlp
+from word_index import build_word_index
+
+
+def test_missing_tokens_use_bounded_syllable_cache(monkeypatch):
+    pytest.importorskip('numpy')
+    word_index = build_word_index({'Hund': 3, 'Katze': 1}, min_count=2)
+    syllable_cache = nlp.SyllableCache(max_size=2)
+    monkeypatch.setattr(nlp, 'shared_syllable_cache', syllable_cache)
+    tokens = ['Hund', 'Katze', 'Aufmerksamkeit', 'Lesbarkeit', 'Ei']
+    syllables, characters = word_index.lookup(tokens)
+    assert syllables.tolist() == [nlp.get_num_syllables(token) for token in tokens]
+    assert characters.tolist() == [len(token) for token in tokens]
+    assert word_index.get_statistics()['misses'] == 4
+    assert syllable_cache.get_statistics()['misses'] == 4
+    assert len(syllable_cache.syllables) == 2
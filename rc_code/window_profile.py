@@ -0,0 +1,135 @@
+__author__ = 'zweiss'
+
+import sys
+
+import counts as cnt
+import features as feat
+import readability_formulae as rf
+import nlp
+from counts import Counts
+
+
+class WindowProfile:
+    """
+    Readability of windows of consecutive sentences of a document, e.g. to find hard passages of long documents. The
+    counts of every sentence are added up to prefix sums once, so the counts of any window are the difference of two
+    prefix sums and a profile of all windows of a document takes linear time
+    """
+
+    def __init__(self, tokenized_sentences, count_file='counts.txt'):
+        """
+        Counts every sentence and sums up the counts
+        :param tokenized_sentences: iterable of tokenized sentences
+        :param count_file: file containing the counts
+        """
+
+        engine = cnt.get_engine(count_file)
+        self.schema = engine.schema
+
+        # prefix_sums[name][i] is the sum of the count over the first i sentences
+        self.prefix_sums = {name: [0] for name in Counts.__slots__}
+        for sentence in tokenized_sentences:
+            counts = engine.count([sentence])
+            for name, sums in self.prefix_sums.items():
+                sums.append(sums[-1] + getattr(counts, name))
+        self.num_sentences = len(self.prefix_sums['num_sentences']) - 1
+
+    def get_counts(self, start, end):
+        """
+        Returns the counts of a window
+        :param start: index of the first sentence of the window
+        :param end: index after the last sentence of the window
+        :return: dictionary of counts
+        """
+
+        if not 0 <= start <= end <= self.num_sentences:
+            raise ValueError('Invalid window: ' + str(start) + ' to ' + str(end) + ' of ' +
+                             str(self.num_sentences) + ' sentence(s)')
+        return {'COUNTS_' + name: self.prefix_sums[name][end] - self.prefix_sums[name][start] for name in self.schema}
+
+    def get_readability(self, start, end):
+        """
+        Calculates readability formulae for a window
+        :param start: index of the first sentence of the window
+        :param end: index after the last sentence of the window
+        :return: dictionary containing formulae, features and counts for the window
+        """
+
+        # get counts
+        rval = self.get_counts(start, end)
+
+        # get features
+        rval.update(feat.get_features(rval))
+
+        # get formulae
+        rval.update(rf.get_formulae(rval))
+
+        return rval
+
+    def iter_windows(self, window_size, step=1):
+        """
+        Calculates readability formulae for all windows of a given size. A document shorter than the window size is a
+        single window. If the steps from the first window do not reach a window ending with the last sentence, such a
+        window is added, so the end of the document is always profiled; it overlaps the window before it by more than
+        step allows
+        :param window_size: number of sentences per window, 1 gives a profile of single sentences
+        :param step: number of sentences between the starts of consecutive windows
+        :return: generator of tuples of index of the first sentence, index after the last sentence and dictionary
+        containing formulae, features and counts for the window
+        """
+
+        if window_size < 1 or step < 1:
+            raise ValueError('Window size and step have to be positive')
+        if self.num_sentences == 0:
+            return
+        last_start = max(self.num_sentences - window_size, 0)
+        for start in range(0, last_start + 1, step):
+            end = min(start + window_size, self.num_sentences)
+            yield start, end, self.get_readability(start, end)
+        if last_start % step != 0:
+            yield last_start, self.num_sentences, self.get_readability(last_start, self.num_sentences)
+
+
+def get_window_profile(input_file, window_size, step=1):
+    """
+    Calculates readability formulae for all windows of consecutive sentences of a file
+    :param input_file: input file
+    :param window_size: number of sentences per window
+    :param step: number of sentences between the starts of consecutive windows
+    :return: list of tuples of index of the first sentence, index after the last sentence and dictionary containing
+    formulae, features and counts for the window
+    """
+
+    with open(input_file, 'r') as content_file:
+        profile = WindowProfile(nlp.iter_tokenized_sentences(nlp.iter_chunks(content_file)))
+    return list(profile.iter_windows(window_size, step))
+
+
+if __name__ == '__main__':
+
+    # check for correct number of arguments
+    usage = 'Wrong number of arguments, call: python3 window_profile.py <input file> <output file> ' \
+            '<window size in sentences> (--step N)'
+    if len(sys.argv) < 4 or not sys.argv[3].isdigit() or int(sys.argv[3]) < 1:
+        sys.exit(usage)
+
+    # read optional arguments
+    step = 1
+    args = sys.argv[4:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == '--step' and len(args) > 0 and args[0].isdigit() and int(args[0]) > 0:
+            step = int(args.pop(0))
+        else:
+            sys.exit(usage)
+
+    # save one row per window
+    windows = get_window_profile(sys.argv[1], int(sys.argv[3]), step)
+    with open(sys.argv[2], 'w') as out:
+        keys = None
+        for start, end, result in windows:
+            if keys is None:
+                keys = sorted(result.keys())
+                out.write('start,end,' + ','.join(keys) + '\n')
+            out.write(str(start) + ',' + str(end) + ''.join([',' + str(result[key]) for key in keys]) + '\n')
+    print(str(len(windows)) + ' window(s) written to ' + sys.argv[2])
@@ -0,0 +1,143 @@
+__author__ = 'zweiss'
+
+from atomic_file import open_atomic
+from nlp import get_num_syllables
+from nlp import get_syllable_cache
+
+# files of an index next to the prefix it is saved to, see WordIndex.save
+INDEX_FILES = ('vocabulary', 'syllables', 'characters')
+
+
+class WordIndex:
+    """
+    Precomputed properties of a vocabulary of word tokens: a sorted array of the UTF-8 encoded tokens with parallel
+    arrays of their numbers of syllables and characters. Saved indices are memory mapped, so all worker processes
+    share one copy in the page cache. Tokens are looked up by binary search with numpy, a whole vocabulary at once,
+    see lookup. Tokens not in the index, e.g. words unseen when the index was built, are counted with the bounded
+    syllable cache of the process, see nlp.get_syllable_cache. Needs numpy
+    """
+
+    def __init__(self, vocabulary, syllables, characters):
+        """
+        Sets up the index
+        :param vocabulary: sorted numpy array of UTF-8 encoded tokens of dtype S
+        :param syllables: numpy array of the number of syllables of every token
+        :param characters: numpy array of the number of characters of every token
+        """
+
+        self.vocabulary = vocabulary
+        self.syllables = syllables
+        self.characters = characters
+        self.width = vocabulary.dtype.itemsize
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, tokens):
+        """
+        Returns the numbers of syllables and characters of tokens
+        :param tokens: list of tokens, preferably without duplicates
+        :return: tuple of numpy arrays of the numbers of syllables and characters, in the order of the tokens
+        """
+
+        import numpy as np
+
+        encoded = [token.encode('utf-8') for token in tokens]
+        syllables = np.zeros(len(tokens), dtype=np.int64)
+        characters = np.zeros(len(tokens), dtype=np.int64)
+        if len(self.vocabulary) > 0 and len(tokens) > 0:
+            # numpy would truncate longer tokens and strip trailing null bytes, such tokens are never in the index
+            valid = np.fromiter((len(key) <= self.width and not key.endswith(b'\x00') for key in encoded), bool,
+                                len(encoded))
+            keys = np.array(encoded, dtype=self.vocabulary.dtype)
+            positions = np.minimum(np.searchsorted(self.vocabulary, keys), len(self.vocabulary) - 1)
+            found = valid & (self.vocabulary[positions] == keys)
+            syllables[found] = self.syllables[positions[found]]
+            characters[found] = self.characters[positions[found]]
+            missing = np.flatnonzero(~found).tolist()
+        else:
+            missing = range(len(tokens))
+        self.hits += len(tokens) - len(missing)
+        self.misses += len(missing)
+
+        syllable_cache = get_syllable_cache()
+        for i in missing:
+            syllables[i] = syllable_cache.get_num_syllables(tokens[i])
+            characters[i] = len(tokens[i])
+        return syllables, characters
+
+    def get_statistics(self):
+        """
+        Returns the hit and miss statistics of the index
+        :return: dictionary of hits, misses, size of the vocabulary and hit rate
+        """
+
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.vocabulary),
+                'hit_rate': 0 if lookups == 0 else self.hits / lookups}
+
+    def save(self, index_prefix):
+        """
+        Saves the arrays of the index to .npy files, see INDEX_FILES and atomic_file.open_atomic
+        :param index_prefix: path the names of the files start with
+        """
+
+        import numpy as np
+
+        for name, values in zip(INDEX_FILES, (self.vocabulary, self.syllables, self.characters)):
+            with open_atomic(index_prefix + '.' + name + '.npy', 'wb') as out:
+                np.save(out, values)
+
+
+def build_word_index(token_counts, min_count=1, max_width=64):
+    """
+    Builds an index of word tokens
+    :param token_counts: dictionary of tokens with their frequencies
+    :param min_count: minimal frequency of tokens in the index, rarer tokens are left to the syllable cache
+    :param max_width: maximal length of tokens in the index in UTF-8 bytes, the width of the vocabulary array
+    :return: WordIndex
+    """
+
+    import numpy as np
+
+    tokens = sorted(token.encode('utf-8') for token, count in token_counts.items() if count >= min_count)
+    tokens = [token for token in tokens if 0 < len(token) <= max_width and not token.endswith(b'\x00')]
+    vocabulary = np.array(tokens, dtype='S' + str(max(max(map(len, tokens), default=1), 1)))
+    decoded = [token.decode('utf-8') for token in tokens]
+    syllables = np.fromiter(map(get_num_syllables, decoded), np.uint8, len(decoded))
+    characters = np.fromiter(map(len, decoded), np.uint16, len(decoded))
+    return WordIndex(vocabulary, syllables, characters)
+
+
+def load_word_index(index_prefix):
+    """
+    Loads an index saved by WordIndex.save, memory mapped
+    :param index_prefix: path the names of the files start with
+    :return: WordIndex
+    """
+
+    import numpy as np
+
+    return WordIndex(*[np.load(index_prefix + '.' + name + '.npy', mmap_mode='r') for name in INDEX_FILES])
+
+
+# word index shared by all calls within this process, see get_word_index
+shared_word_index = None
+
+
+def get_word_index():
+    """
+    Returns the word index of this process
+    :return: WordIndex, None if no index is used
+    """
+
+    return shared_word_index
+
+
+def set_word_index(word_index):
+    """
+    Sets the word index used by the batch counter of this process, see counts.CountingEngine.get_counts_batch
+    :param word_index: WordIndex, None to count all tokens with the syllable cache
+    """
+
+    global shared_word_index
+    shared_word_index = word_index
@@ -0,0 +1,260 @@
+__author__ = 'zweiss'
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def iter_files(cur_dir, extension='.txt'):
+    """
+    Recursively finds all files with a given extension in a directory and all subdirectories, in the same order as
+    os.walk. Files are returned while a directory is scanned, so only the subdirectories still to be visited are kept
+    in memory and not a listing of the whole tree. Symbolic links to directories are not followed, directories that
+    cannot be read are skipped
+    :param cur_dir: directory to be searched
+    :param extension: extension of the files
+    :return: generator of file paths
+    """
+
+    # directories still to be visited, the next one on top
+    stack = [cur_dir]
+    while len(stack) > 0:
+        subdirectories = []
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink():
+                            subdirectories.append(entry.path)
+                    elif entry.name.endswith(extension):
+                        yield entry.path
+        except OSError:
+            continue
+        stack.extend(reversed(subdirectories))
+
+
+class DirectoryCrawler:
+    """
+    Finds the files of a directory tree in a background thread, see iter_files, and hands them to the analysis through
+    a bounded queue. The crawler waits while the queue is full, so the analysis starts with the first file found and
+    the memory does not grow with the size of the tree
+    """
+
+    def __init__(self, cur_dir, extension='.txt', queue_size=10000, batch_size=256):
+        """
+        Sets up the crawler, the crawl starts when the files are iterated
+        :param cur_dir: directory to be searched
+        :param extension: extension of the files
+        :param queue_size: maximal number of files found but not yet taken from the queue
+        :param batch_size: maximal number of files put into the queue at once
+        """
+
+        self.cur_dir = cur_dir
+        self.extension = extension
+        self.batch_size = min(batch_size, queue_size)
+        self.queue = queue.Queue(max(queue_size // self.batch_size, 1))
+        self.stopped = threading.Event()
+        self.thread = None
+        self.error = None
+        self.num_files = 0
+
+    def crawl(self):
+        """
+        Puts all files into the queue followed by None, run by the background thread. Files are put into the queue in
+        batches, which saves waking up the consuming thread for every file; a batch is put early while the queue is
+        empty, so the consumer does not wait for a full batch
+        """
+
+        try:
+            batch = []
+            for path in iter_files(self.cur_dir, self.extension):
+                batch.append(path)
+                if len(batch) >= self.batch_size or self.queue.empty():
+                    if not self.put(batch):
+                        return
+                    batch = []
+            if len(batch) > 0 and not self.put(batch):
+                return
+        except Exception as e:
+            self.error = e
+        self.put(None)
+
+    def put(self, item):
+        """
+        Puts an item into the queue, waits while the queue is full
+        :param item: list of file paths or None after the last file
+        :return: True if the item was put into the queue, False if the crawler was closed in the meantime
+        """
+
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        """
+        Starts the crawl and returns the files as they are found
+        :return: generator of file paths
+        """
+
+        self.thread = threading.Thread(target=self.crawl, daemon=True)
+        self.thread.start()
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            for path in batch:
+                self.num_files += 1
+                yield path
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Stops the crawl if it is still running
+        """
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class Prefetcher:
+    """
+    Reads files ahead in a thread pool, so that reading the next files overlaps with analysing the current one, e.g.
+    on network file systems where every read waits for the server. At most depth items are buffered ahead of the
+    consumer, which bounds the memory of the read texts
+    """
+
+    def __init__(self, depth=8, threads=None):
+        """
+        Sets up the thread pool
+        :param depth: maximal number of items read ahead of the consumer
+        :param threads: number of reading threads, as many as the depth if None
+        """
+
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(depth if threads is None else threads)
+        self.lock = threading.Lock()
+        self.num_files = 0
+        self.num_characters = 0
+        self.read_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.num_ready = 0
+
+    def read(self, input_file):
+        """
+        Reads a file as text, run by the reading threads
+        :param input_file: input file
+        :return: text of the file
+        """
+
+        start = time.perf_counter()
+        with open(input_file, 'r') as content_file:
+            text = content_file.read()
+        with self.lock:
+            self.num_files += 1
+            self.num_characters += len(text)
+            self.read_seconds += time.perf_counter() - start
+        return text
+
+    def iter_prefetched(self, items, get_input_file):
+        """
+        Reads the files of items ahead and returns the items with the texts of their files, in the order of the items
+        :param items: iterable of items
+        :param get_input_file: function returning the file of an item, None for items without a file to be read
+        :return: generator of tuples of item and text of its file, None for items without a file
+        """
+
+        pending = deque()
+        for item in items:
+            input_file = get_input_file(item)
+            pending.append((item, None if input_file is None else self.executor.submit(self.read, input_file)))
+            if len(pending) > self.depth:
+                yield self.get(*pending.popleft())
+        while len(pending) > 0:
+            yield self.get(*pending.popleft())
+
+    def get(self, item, future):
+        """
+        Waits for the text of an item
+        :param item: item
+        :param future: Future of the text, None for items without a file
+        :return: tuple of item and text
+        """
+
+        if future is None:
+            return item, None
+        if future.done():
+            self.num_ready += 1
+            return item, future.result()
+        start = time.perf_counter()
+        text = future.result()
+        self.wait_seconds += time.perf_counter() - start
+        return item, text
+
+    def get_statistics(self):
+        """
+        Returns the statistics of the reads
+        :return: dictionary of depth, number of files, characters read, seconds spent reading, seconds the consumer
+        waited for reads and the rate of files that were read completely before they were needed
+        """
+
+        return {'depth': self.depth, 'files': self.num_files, 'characters': self.num_characters,
+                'read_seconds': self.read_seconds, 'wait_seconds': self.wait_seconds,
+                'ready_rate': 0 if self.num_files == 0 else self.num_ready / self.num_files}
+
+    def close(self):
+        """
+        Stops the reading threads
+        """
+
+        self.executor.shutdown()
+
+
+def imap_bounded(function, jobs, pool=None, max_in_flight=16):
+    """
+    Applies a function to all jobs and returns the results in the order of the jobs, like Pool.imap. Pool.imap takes
+    all jobs from the iterable at once, here at most max_in_flight jobs are submitted to the pool whose results have
+    not been returned yet, so further jobs are only taken from the iterable as the results are consumed
+    :param function: function to be applied, has to be picklable if a pool is given
+    :param jobs: iterable of jobs
+    :param pool: multiprocessing pool, the jobs are processed one by one in this process if None
+    :param max_in_flight: maximal number of submitted jobs whose results have not been returned
+    :return: generator of results
+    """
+
+    if pool is None:
+        for job in jobs:
+            yield function(job)
+        return
+
+    in_flight = deque()
+    for job in jobs:
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().get()
+        in_flight.append(pool.apply_async(function, (job,)))
+    while len(in_flight) > 0:
+        yield in_flight.popleft().get()
+
+
+def run_jobs(task):
+    """
+    Runs several jobs as a single task, so that they are sent to a pool worker at once
+    :param task: tuple of job function and list of jobs
+    :return: list of the return values of the job function
+    """
+
+    function, jobs = task
+    return [function(job) for job in jobs]